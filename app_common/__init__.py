@@ -0,0 +1 @@
+"""Code shared by the paralympic and iris apps, used by the create_app() of each."""
@@ -0,0 +1,107 @@
+"""gzip/deflate compression of responses.
+
+Responses are compressed when the client accepts gzip or deflate (Accept-Encoding), the
+content type is text based and the body is at least COMPRESS_MIN_SIZE bytes. This
+includes the files in static/.
+
+The compressed body of a response that has an ETag is kept in memory keyed by the ETag,
+so the same content is only compressed once. As the compressed bytes differ from the
+original, the ETag is made weak (W/"...") in the same way as nginx does, which still
+matches the original in an If-None-Match header.
+"""
+import gzip
+import threading
+import zlib
+from collections import OrderedDict
+from flask import request
+
+COMPRESSIBLE_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/csv",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "application/x-ndjson",
+    "image/svg+xml",
+}
+
+
+class CompressedCache:
+    """Least recently used store of compressed bodies, keyed by (etag, encoding)"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+            return self._data.get(key)
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+def init_compression(app):
+    """Registers an after_request function that compresses the responses of the app
+
+    Args:
+        app: the Flask app, configured with COMPRESS_MIN_SIZE, COMPRESS_LEVEL and
+            COMPRESS_CACHE_SIZE
+    """
+    cache = CompressedCache(app.config["COMPRESS_CACHE_SIZE"])
+
+    @app.after_request
+    def compress_response(response):
+        if (
+            response.status_code != 200
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or "Content-Encoding" in response.headers
+            # Streamed responses are left as they are, except files such as static/
+            or (response.is_streamed and not response.direct_passthrough)
+        ):
+            return response
+        size = response.content_length
+        if size is None or size < app.config["COMPRESS_MIN_SIZE"]:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(["gzip", "deflate"])
+        if encoding is None:
+            return response
+
+        etag, _ = response.get_etag()
+        key = (etag, encoding)
+        body = cache.get(key) if etag else None
+        if body is None:
+            # Reads the file for responses from send_file()
+            response.direct_passthrough = False
+            body = compress(
+                response.get_data(), encoding, app.config["COMPRESS_LEVEL"]
+            )
+            if etag:
+                cache.set(key, body)
+        else:
+            # Close the file that would have been sent
+            response.close()
+
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        if etag:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def compress(data, encoding, level):
+    """Returns data compressed with gzip or deflate (zlib format as used in HTTP)"""
+    if encoding == "gzip":
+        # A fixed mtime means the same data always gives the same bytes
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    return zlib.compress(data, level)
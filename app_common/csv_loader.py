@@ -0,0 +1,511 @@
+"""Fast loading of csv files into SQLite tables.
+
+The csv file is read in chunks, so the memory used doesn't depend on the size of the
+file, and each chunk is added with a single executemany INSERT. The whole load is one
+transaction, so either all the rows are added or, if there is an error, none are.
+
+While loading, the connection uses pragmas that trade safety for speed:
+synchronous=OFF doesn't wait for the disk, and journal_mode=MEMORY keeps the rollback
+journal in memory. Use journal_mode=OFF for a little more speed, but then a failed load
+can't be rolled back. The journal mode of the database, e.g. WAL, is restored afterwards.
+The indexes of an existing table are dropped before the rows are added and created again
+after, which is faster than updating them for every row. Triggers are kept.
+
+SQLite converts the text from the csv file to the type of the column, e.g. "1960" to
+1960 in an INTEGER column.
+
+To refresh a table from a new version of its csv file, sync_csv() only writes the rows
+that have changed. A hash of each row of the csv file is stored in the row_hash column,
+so the rows whose hash is unchanged are skipped, the new and changed rows are written
+with an INSERT ... ON CONFLICT DO UPDATE and the rows that are no longer in the file are
+deleted. Running it again with the same file doesn't change the table.
+
+It is used by the csv_to_sqlite*.py scripts in the data folder of each app.
+
+Usage, from the project root or after pip install -e .:
+    python -m app_common.csv_loader paralympics.db event events.csv --replace
+    python -m app_common.csv_loader paralympics.db event events.csv --sync --key event_id
+    python -m app_common.csv_loader iris.db iris iris.csv --sync
+"""
+import argparse
+import csv
+import gc
+import hashlib
+import sqlite3
+import time
+from itertools import islice
+from operator import itemgetter
+from pathlib import Path
+
+LOADER_PRAGMAS = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF",
+    "temp_store": "MEMORY",
+    # Negative is in KiB, so 200MB of page cache
+    "cache_size": -200000,
+}
+# The sync is for a database that may be in use, so it doesn't change the journal mode
+SYNC_PRAGMAS = {
+    "synchronous": "OFF",
+    "temp_store": "MEMORY",
+    "cache_size": -200000,
+}
+HASH_COLUMN = "row_hash"
+
+
+def load_csv(
+    db_file,
+    table,
+    csv_file,
+    column_types=None,
+    null_values=("",),
+    chunk_size=50000,
+    replace=False,
+    pragmas=None,
+):
+    """Adds the rows of a csv file to a table in a SQLite database.
+
+    The first row of the csv file is the column names.
+
+    Args:
+        db_file: path of the SQLite database file, created if it doesn't exist
+        table: the name of the table
+        csv_file: path of the csv file
+        column_types: dict of column name and SQL type, used to create the table if it
+            doesn't exist. If None the table must already exist.
+        null_values: values in the csv file that are stored as NULL
+        chunk_size: the number of rows read and inserted at a time
+        replace: if True, the existing rows of the table are deleted first
+        pragmas: dict of the pragmas to use while loading, defaults to LOADER_PRAGMAS
+
+    Returns:
+        dict of the table, the number of rows loaded, the time taken in seconds and the
+        rows per second
+
+    Raises:
+        ValueError: if the csv file is empty or a row doesn't have a value for each
+            column, in which case no rows are added
+    """
+    pragmas = LOADER_PRAGMAS if pragmas is None else pragmas
+    start = time.perf_counter()
+    # Autocommit mode, so the transaction is controlled by the BEGIN and COMMIT below
+    connection = sqlite3.connect(db_file, isolation_level=None)
+    journal_mode = None
+    try:
+        journal_mode = connection.execute("PRAGMA journal_mode").fetchone()[0]
+        for name, value in pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+
+        with open(csv_file, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            columns = read_columns(reader, csv_file)
+            connection.execute("BEGIN")
+            try:
+                if column_types is not None:
+                    create_table(connection, table, columns, column_types)
+                if replace:
+                    connection.execute(f'DELETE FROM "{table}"')
+                indexes = drop_indexes(connection, table)
+                # The rows of a chunk don't have reference cycles, so the garbage
+                # collector passes triggered by creating them are wasted time
+                gc_enabled = gc.isenabled()
+                gc.disable()
+                try:
+                    rows = insert_rows(
+                        connection,
+                        table,
+                        columns,
+                        reader,
+                        null_values,
+                        chunk_size,
+                    )
+                finally:
+                    if gc_enabled:
+                        gc.enable()
+                for sql in indexes:
+                    connection.execute(sql)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+    finally:
+        # Also after an error, as a change from WAL is saved in the database file
+        if journal_mode is not None:
+            connection.execute(f"PRAGMA journal_mode = {journal_mode}")
+        connection.close()
+
+    seconds = time.perf_counter() - start
+    return {
+        "table": table,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else None,
+    }
+
+
+def create_table(connection, table, columns, column_types, key_columns=None):
+    """Creates the table, if it doesn't exist, with the columns in the csv file"""
+    definitions = [
+        f'"{column}" {column_types.get(column, "TEXT")}' for column in columns
+    ]
+    if key_columns:
+        definitions.append(f"PRIMARY KEY ({quote(key_columns)})")
+    connection.execute(
+        f'CREATE TABLE IF NOT EXISTS "{table}" ({", ".join(definitions)})'
+    )
+
+
+def quote(columns):
+    """Returns the column names quoted and separated by commas"""
+    return ", ".join(f'"{column}"' for column in columns)
+
+
+def drop_indexes(connection, table):
+    """Drops the indexes of a table and returns the SQL to create them again.
+
+    Indexes that SQLite creates for a PRIMARY KEY or UNIQUE constraint have no SQL and
+    can't be dropped, so they are kept.
+    """
+    indexes = connection.execute(
+        "SELECT name, sql FROM sqlite_master "
+        "WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,),
+    ).fetchall()
+    for name, _ in indexes:
+        connection.execute(f'DROP INDEX "{name}"')
+    return [sql for _, sql in indexes]
+
+
+def read_columns(reader, csv_file):
+    """Returns the column names from the first row of a csv reader
+
+    Raises:
+        ValueError: if the csv file is empty
+    """
+    try:
+        return next(reader)
+    except StopIteration:
+        raise ValueError(
+            f"{csv_file} is empty, expected the column names"
+        ) from None
+
+
+def read_chunks(reader, columns, chunk_size):
+    """Yields lists of at most chunk_size rows from a csv reader
+
+    Raises:
+        ValueError: if a row doesn't have a value for each column
+    """
+    count = 0
+    while True:
+        chunk = list(islice(reader, chunk_size))
+        if not chunk:
+            return
+        if set(map(len, chunk)) != {len(columns)}:
+            i = next(
+                i for i, row in enumerate(chunk) if len(row) != len(columns)
+            )
+            raise ValueError(
+                f"Row {count + i + 2} has {len(chunk[i])} values, "
+                f"expected {len(columns)}"
+            )
+        yield chunk
+        count += len(chunk)
+
+
+def insert_rows(connection, table, columns, reader, null_values, chunk_size):
+    """Inserts the rows from a csv reader a chunk at a time and returns the row count"""
+    placeholders = ", ".join("?" * len(columns))
+    insert = (
+        f'INSERT INTO "{table}" ({quote(columns)}) VALUES ({placeholders})'
+    )
+    null_values = set(null_values)
+    count = 0
+    for chunk in read_chunks(reader, columns, chunk_size):
+        for i, row in enumerate(chunk):
+            # Most rows have no null values, so only those that do are copied
+            if not null_values.isdisjoint(row):
+                chunk[i] = [None if v in null_values else v for v in row]
+        connection.executemany(insert, chunk)
+        count += len(chunk)
+    return count
+
+
+def sync_csv(
+    db_file,
+    table,
+    csv_file,
+    key_columns=None,
+    column_types=None,
+    null_values=("",),
+    chunk_size=50000,
+    pragmas=None,
+):
+    """Updates a table in a SQLite database to match the rows of a csv file.
+
+    Only the new and changed rows are written and the rows that aren't in the csv file
+    are deleted, see the module docstring. The row_hash column is added to the table if
+    it doesn't have it, so the first sync of a table loaded in another way updates every
+    row. The whole sync is one transaction.
+
+    The rows are matched on the key columns, compared as text. If the table has no
+    PRIMARY KEY or UNIQUE index on them, duplicate rows are deleted, keeping the first,
+    and a unique index is created. Without key columns the rows are matched on their
+    position, row n of the csv file is the row with rowid n.
+
+    Args:
+        db_file: path of the SQLite database file, created if it doesn't exist
+        table: the name of the table
+        csv_file: path of the csv file
+        key_columns: list of the columns that identify a row, or None to use the
+            position of the row
+        column_types: dict of column name and SQL type, used to create the table if it
+            doesn't exist. If None the table must already exist.
+        null_values: values in the csv file that are stored as NULL
+        chunk_size: the number of rows read and written at a time
+        pragmas: dict of the pragmas to use while syncing, defaults to SYNC_PRAGMAS
+
+    Returns:
+        dict of the table, the number of rows in the csv file, the numbers of rows
+        inserted, updated, deleted and unchanged, the time taken in seconds and the
+        rows per second
+
+    Raises:
+        ValueError: if the csv file is empty, a row doesn't have a value for each
+            column or two rows have the same key, in which case the table isn't changed
+    """
+    pragmas = SYNC_PRAGMAS if pragmas is None else pragmas
+    start = time.perf_counter()
+    result = {
+        "table": table,
+        "rows": 0,
+        "inserted": 0,
+        "updated": 0,
+        "deleted": 0,
+        "unchanged": 0,
+    }
+    connection = sqlite3.connect(db_file, isolation_level=None)
+    try:
+        for name, value in pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+
+        with open(csv_file, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            columns = read_columns(reader, csv_file)
+            connection.execute("BEGIN")
+            try:
+                if column_types is not None:
+                    create_table(
+                        connection, table, columns, column_types, key_columns
+                    )
+                add_hash_column(connection, table)
+                if key_columns:
+                    result["deleted"] += add_unique_key(
+                        connection, table, key_columns
+                    )
+                # As in load_csv(), the garbage collector isn't needed for the rows
+                gc_enabled = gc.isenabled()
+                gc.disable()
+                try:
+                    sync_rows(
+                        connection,
+                        table,
+                        columns,
+                        reader,
+                        key_columns,
+                        set(null_values),
+                        chunk_size,
+                        result,
+                    )
+                finally:
+                    if gc_enabled:
+                        gc.enable()
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+    finally:
+        connection.close()
+
+    result["seconds"] = time.perf_counter() - start
+    result["rows_per_second"] = (
+        result["rows"] / result["seconds"] if result["seconds"] else None
+    )
+    return result
+
+
+def add_hash_column(connection, table):
+    """Adds the row_hash column to the table if it doesn't have it"""
+    names = [
+        row[1] for row in connection.execute(f'PRAGMA table_info("{table}")')
+    ]
+    if HASH_COLUMN not in names:
+        connection.execute(
+            f'ALTER TABLE "{table}" ADD COLUMN "{HASH_COLUMN}" BLOB'
+        )
+
+
+def add_unique_key(connection, table, key_columns):
+    """Makes sure the key columns are unique in the table, so they can be the ON
+    CONFLICT target of the upsert. Returns the number of duplicate rows deleted.
+    """
+    table_info = connection.execute(f'PRAGMA table_info("{table}")').fetchall()
+    if {row[1] for row in table_info if row[5]} == set(key_columns):
+        return 0
+    for _, index, unique, _, partial in connection.execute(
+        f'PRAGMA index_list("{table}")'
+    ):
+        names = {
+            row[2]
+            for row in connection.execute(f'PRAGMA index_info("{index}")')
+        }
+        if unique and not partial and names == set(key_columns):
+            return 0
+
+    keys = quote(key_columns)
+    deleted = connection.execute(
+        f'DELETE FROM "{table}" WHERE rowid NOT IN '
+        f'(SELECT min(rowid) FROM "{table}" GROUP BY {keys})'
+    ).rowcount
+    connection.execute(
+        f'CREATE UNIQUE INDEX "ix_{table}_sync_key" ON "{table}" ({keys})'
+    )
+    return deleted
+
+
+def sync_rows(
+    connection,
+    table,
+    columns,
+    reader,
+    key_columns,
+    null_values,
+    chunk_size,
+    result,
+):
+    """Upserts the new and changed rows from a csv reader and deletes the rows that
+    aren't in it, adding the counts to result
+    """
+    keys = key_columns or ["rowid"]
+    # The stored hashes of all the rows by key, the keys that are still in the dict
+    # after reading the csv file are those of the rows to delete. A key is the text of
+    # the key column, a tuple of them if there are more than one, or the rowid.
+    rows = connection.execute(
+        f'SELECT "{HASH_COLUMN}", {quote(keys)} FROM "{table}"'
+    )
+    if not key_columns:
+        stored = {rowid: stored_hash for stored_hash, rowid in rows}
+    elif len(key_columns) == 1:
+        stored = {str(key): stored_hash for stored_hash, key in rows}
+    else:
+        stored = {tuple(map(str, row[1:])): row[0] for row in rows}
+
+    names = columns if key_columns else ["rowid"] + columns
+    updates = ", ".join(
+        f'"{name}" = excluded."{name}"'
+        for name in names + [HASH_COLUMN]
+        if name not in keys
+    )
+    upsert = (
+        f'INSERT INTO "{table}" ({quote(names + [HASH_COLUMN])}) '
+        f'VALUES ({", ".join("?" * (len(names) + 1))}) '
+        f"ON CONFLICT ({quote(keys)}) DO UPDATE SET {updates}"
+    )
+    if key_columns:
+        get_key = itemgetter(*[columns.index(key) for key in key_columns])
+    # The keys read so far, as the upsert of a repeated key would overwrite the row
+    seen = set()
+    for chunk in read_chunks(reader, columns, chunk_size):
+        changed = []
+        for row in chunk:
+            result["rows"] += 1
+            key = get_key(row) if key_columns else result["rows"]
+            if key in seen:
+                raise ValueError(
+                    f"Row {result['rows'] + 1} has the same key as an earlier row"
+                )
+            seen.add(key)
+            new_hash = hashlib.blake2b(
+                "\x1f".join(row).encode(), digest_size=8
+            ).digest()
+            if key not in stored:
+                result["inserted"] += 1
+            elif stored.pop(key) != new_hash:
+                result["updated"] += 1
+            else:
+                result["unchanged"] += 1
+                continue
+            values = [None if v in null_values else v for v in row]
+            if not key_columns:
+                values.insert(0, key)
+            values.append(new_hash)
+            changed.append(values)
+        connection.executemany(upsert, changed)
+
+    where = " AND ".join(f'"{key}" = ?' for key in keys)
+    connection.executemany(
+        f'DELETE FROM "{table}" WHERE {where}',
+        (key if isinstance(key, tuple) else (key,) for key in stored),
+    )
+    result["deleted"] += len(stored)
+
+
+def report(result):
+    """Prints the number of rows loaded or synced and the rows per second"""
+    if "updated" in result:
+        print(
+            f"Synced {result['rows']} rows into {result['table']} in "
+            f"{result['seconds']:.2f}s ({result['rows_per_second']:.0f} rows/s): "
+            f"{result['inserted']} inserted, {result['updated']} updated, "
+            f"{result['deleted']} deleted, {result['unchanged']} unchanged"
+        )
+    else:
+        print(
+            f"Loaded {result['rows']} rows into {result['table']} in "
+            f"{result['seconds']:.2f}s ({result['rows_per_second']:.0f} rows/s)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("db_file", type=Path)
+    parser.add_argument("table")
+    parser.add_argument("csv_file", type=Path)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument(
+        "--replace",
+        action="store_true",
+        help="delete the existing rows of the table first",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="only write the changed rows and delete those not in the file",
+    )
+    parser.add_argument(
+        "--key",
+        action="append",
+        help="a column that identifies a row for --sync, by default the row number",
+    )
+    args = parser.parse_args()
+    if args.sync:
+        result = sync_csv(
+            args.db_file,
+            args.table,
+            args.csv_file,
+            args.key,
+            chunk_size=args.chunk_size,
+        )
+    else:
+        result = load_csv(
+            args.db_file,
+            args.table,
+            args.csv_file,
+            chunk_size=args.chunk_size,
+            replace=args.replace,
+        )
+    report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""Request metrics exposed at /metrics in the Prometheus text format.
+
+Enabled with METRICS_ENABLED = True in the config. For each endpoint the app records:
+
+- http_requests_total: the number of requests, by method and status code
+- http_request_duration_seconds: the time from the start of the request until the
+  response is returned to the server. For a streamed response this is the time to the
+  start of the body.
+- http_request_db_seconds and http_request_queries: the time spent executing SQL and the
+  number of SQL statements, including those that fail, using the SQLAlchemy cursor
+  execute and handle_error events of the engine. Another engine used by the app, e.g.
+  the async engine of paralympic_app/asgi.py, is added with instrument_engine().
+- http_request_serialization_seconds: the time spent encoding JSON and rendering
+  templates
+- http_response_size_bytes: the size of the response body after compression. Streamed
+  responses are not included as their size isn't known.
+
+The metrics are held in memory and are per process.
+"""
+import threading
+import time
+from flask import g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from jinja2 import Template
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+class Histogram:
+    """Counts of observed values in cumulative buckets, with their sum and count
+
+    Args:
+        buckets: the upper bounds of the buckets, in increasing order
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        """Returns the lines for the histogram in the Prometheus text format"""
+        lines = [
+            f"{name}_bucket{format_labels(labels, le=bound)} {count}"
+            for bound, count in zip(self.buckets, self.counts)
+        ]
+        lines.append(
+            f"{name}_bucket{format_labels(labels, le='+Inf')} {self.count}"
+        )
+        lines.append(f"{name}_sum{format_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{format_labels(labels)} {self.count}")
+        return lines
+
+
+class Metrics:
+    """The request metrics of an app, see the module docstring"""
+
+    HISTOGRAMS = {
+        "http_request_duration_seconds": (
+            "Time to handle a request",
+            LATENCY_BUCKETS,
+        ),
+        "http_request_db_seconds": (
+            "Time spent executing SQL statements in a request",
+            LATENCY_BUCKETS,
+        ),
+        "http_request_queries": (
+            "Number of SQL statements executed in a request",
+            QUERY_BUCKETS,
+        ),
+        "http_request_serialization_seconds": (
+            "Time spent encoding JSON and rendering templates in a request",
+            LATENCY_BUCKETS,
+        ),
+        "http_response_size_bytes": (
+            "Size of the response body",
+            SIZE_BUCKETS,
+        ),
+    }
+
+    def __init__(self):
+        self.requests = {}
+        self.histograms = {name: {} for name in self.HISTOGRAMS}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, method, status, values):
+        """Records a request
+
+        Args:
+            endpoint: the Flask endpoint of the request
+            method: the HTTP method
+            status: the response status code
+            values: dict of the value for each histogram, a missing value isn't recorded
+        """
+        labels = (("endpoint", endpoint), ("method", method))
+        with self._lock:
+            key = labels + (("status", str(status)),)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for name, value in values.items():
+                histograms = self.histograms[name]
+                if labels not in histograms:
+                    histograms[labels] = Histogram(self.HISTOGRAMS[name][1])
+                histograms[labels].observe(value)
+
+    def render(self):
+        """Returns all the metrics in the Prometheus text format"""
+        lines = [
+            "# HELP http_requests_total Number of requests",
+            "# TYPE http_requests_total counter",
+        ]
+        with self._lock:
+            for labels, count in sorted(self.requests.items()):
+                lines.append(
+                    f"http_requests_total{format_labels(labels)} {count}"
+                )
+            for name, (description, _) in self.HISTOGRAMS.items():
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(self.histograms[name].items()):
+                    lines.extend(histogram.samples(name, labels))
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels, **extra):
+    """Returns labels in the Prometheus format, e.g. {endpoint="index",method="GET"}"""
+    pairs = list(labels) + list(extra.items())
+    escaped = (
+        (
+            name,
+            str(value)
+            .replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n"),
+        )
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def add_serialization_time(start):
+    """Adds the time since start to the serialization time of the current request"""
+    if has_request_context() and "metrics_serialization" in g:
+        g.metrics_serialization += time.perf_counter() - start
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, recording the time spent encoding JSON"""
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            add_serialization_time(start)
+
+
+class TimedTemplate(Template):
+    """Jinja template class, recording the time spent rendering templates"""
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            add_serialization_time(start)
+
+
+def _record_query(conn):
+    """Adds the time since the statement on conn started to the current request"""
+    # A connection executes one statement at a time, so it has one start time
+    start = conn.info.pop("metrics_query_start", None)
+    if start is None:
+        return
+    if has_request_context() and "metrics_start" in g:
+        g.metrics_db += time.perf_counter() - start
+        g.metrics_queries += 1
+
+
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info["metrics_query_start"] = time.perf_counter()
+
+
+def _end_query(conn, cursor, statement, parameters, context, executemany):
+    _record_query(conn)
+
+
+def _failed_query(exception_context):
+    # after_cursor_execute isn't called for a statement that fails
+    if exception_context.connection is not None:
+        _record_query(exception_context.connection)
+
+
+def instrument_engine(engine):
+    """Records the time and number of the SQL statements executed by an engine in the
+    metrics of the current request, see init_metrics()
+
+    Args:
+        engine: a SQLAlchemy Engine, for an AsyncEngine its sync_engine
+    """
+    if event.contains(engine, "before_cursor_execute", _start_query):
+        return
+    event.listen(engine, "before_cursor_execute", _start_query)
+    event.listen(engine, "after_cursor_execute", _end_query)
+    event.listen(engine, "handle_error", _failed_query)
+
+
+def init_metrics(app, engine):
+    """Records the metrics of the requests to the app and adds the /metrics route
+
+    Should be called before other extensions add after_request functions, so the
+    response size is measured after they have run, e.g. after compression.
+
+    Args:
+        app: the Flask app
+        engine: SQLAlchemy engine used by the app
+    """
+    metrics = Metrics()
+    app.extensions["metrics"] = metrics
+    app.json = TimedJSONProvider(app)
+    app.jinja_env.template_class = TimedTemplate
+    instrument_engine(engine)
+
+    @app.before_request
+    def start_request():
+        g.metrics_start = time.perf_counter()
+        g.metrics_db = 0
+        g.metrics_queries = 0
+        g.metrics_serialization = 0
+
+    @app.after_request
+    def end_request(response):
+        if "metrics_start" not in g:
+            return response
+        values = {
+            "http_request_duration_seconds": time.perf_counter()
+            - g.pop("metrics_start"),
+            "http_request_db_seconds": g.metrics_db,
+            "http_request_queries": g.metrics_queries,
+            "http_request_serialization_seconds": g.metrics_serialization,
+        }
+        if response.content_length is not None:
+            values["http_response_size_bytes"] = response.content_length
+        metrics.record(
+            request.endpoint or "none",
+            request.method,
+            response.status_code,
+            values,
+        )
+        return response
+
+    @app.get("/metrics")
+    def metrics_view():
+        """Returns the request metrics in the Prometheus text format"""
+        return (
+            metrics.render(),
+            200,
+            {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
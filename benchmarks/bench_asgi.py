@@ -0,0 +1,191 @@
+"""Compares serving the read routes with the WSGI and the ASGI (asgi.py) apps.
+
+Each mode runs the paralympic app in a separate server process over a temporary
+database with the given number of events, see bench_serializers.py:
+
+- wsgi: the Flask app with a fixed pool of worker threads, like a threaded gunicorn worker
+- asgi: the AsyncReadApp in uvicorn, a single process and event loop
+
+A number of slow clients each send GET requests, pausing for the given delay part way
+through the request headers as a client on a slow network would. While they do so, fast
+clients send the given number of requests. The WSGI workers are each tied
+up by a slow client for the whole delay, so the fast requests wait for a free worker,
+while the ASGI server only does any work once a request has fully arrived. The times and
+requests per second are for the fast requests.
+
+Requires uvicorn and aiosqlite, pip install -e .[async].
+
+Usage: python benchmarks/bench_asgi.py --slow 200 --delay 1 --requests 500
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import socket
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from werkzeug.serving import BaseWSGIServer
+from paralympic_app import create_app, config, db
+from bench_serializers import seed
+
+
+def make_config(db_path):
+    """Returns the config class for the app using the database at db_path"""
+
+    class BenchConfig(config.ProdConfig):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + str(db_path)
+
+    return BenchConfig
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug WSGI server that handles requests with a fixed number of threads"""
+
+    def __init__(self, host, port, app, workers):
+        super().__init__(host, port, app)
+        self.executor = ThreadPoolExecutor(workers)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.handle_in_thread, request, client_address)
+
+    def handle_in_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve(mode, db_path, port, workers):
+    """Runs the app in the given mode until the process is terminated"""
+    if mode == "wsgi":
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        app = create_app(make_config(db_path))
+        PooledWSGIServer("127.0.0.1", port, app, workers).serve_forever()
+    else:
+        import uvicorn
+        from paralympic_app.asgi import create_asgi_app
+
+        app = create_asgi_app(make_config(db_path))
+        uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+async def get(port, path, delay=0):
+    """Sends a GET request with a pause part way through and returns the time taken"""
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n".encode())
+    await writer.drain()
+    await asyncio.sleep(delay)
+    writer.write(b"Connection: close\r\n\r\n")
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    if response.split(b" ", 2)[1] != b"200":
+        raise RuntimeError(f"Unexpected response {response[:40]}")
+    return time.perf_counter() - start
+
+
+async def run_clients(port, args):
+    """Runs the slow and fast clients and returns the fast request times and total time"""
+    done = asyncio.Event()
+
+    async def slow_client():
+        # Keeps sending slow requests until the fast clients have finished
+        while not done.is_set():
+            await get(port, args.path, args.delay)
+
+    slow = [asyncio.create_task(slow_client()) for _ in range(args.slow)]
+    # Give the slow clients time to connect
+    await asyncio.sleep(0.1)
+
+    times = []
+
+    async def fast_client(requests):
+        for _ in range(requests):
+            times.append(await get(port, args.path))
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            fast_client(args.requests // args.concurrency)
+            for _ in range(args.concurrency)
+        )
+    )
+    total = time.perf_counter() - start
+    done.set()
+    await asyncio.gather(*slow)
+    return times, total
+
+
+def wait_for_port(port, timeout=30):
+    """Waits until a server is accepting connections on the port"""
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"No server on port {port}")
+
+
+def free_port():
+    """Returns a port number that isn't in use"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--slow", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=1.0)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--path", default="/event?year=2000")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp).joinpath("bench.db")
+        app = create_app(make_config(db_path))
+        with app.app_context():
+            seed(args.rows)
+            db.engine.dispose()
+
+        print(
+            f"Rows: {args.rows}, slow clients: {args.slow}, delay: {args.delay}s, "
+            f"fast requests: {args.requests}, concurrency: {args.concurrency}, "
+            f"WSGI workers: {args.workers}, path: {args.path}"
+        )
+        for mode in ("wsgi", "asgi"):
+            port = free_port()
+            # A new process rather than a fork, as the routes are only added to the
+            # first app created in a process
+            server = multiprocessing.get_context("spawn").Process(
+                target=serve, args=(mode, db_path, port, args.workers)
+            )
+            server.start()
+            try:
+                wait_for_port(port)
+                times, total = asyncio.run(run_clients(port, args))
+            finally:
+                server.terminate()
+                server.join()
+            times.sort()
+            p95 = times[int(len(times) * 0.95) - 1]
+            print(
+                f"{mode}: {len(times) / total:8.1f} req/s, "
+                f"median {statistics.median(times) * 1000:8.1f} ms, "
+                f"p95 {p95 * 1000:8.1f} ms, total {total:6.2f} s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Measures the latency and throughput of the main routes of both apps.
+
+For each dataset size the app is created with create_app() over a new temporary SQLite
+database seeded with that many rows, by repeating the rows of events.csv or iris.csv.
+Each route is then requested through the Flask test client, one request at a time, and
+through a real local server (werkzeug, threaded, in its own process) by a number of
+concurrent clients. Every app and size is run in a new process, as the routes are only
+added to the first app created in a process.
+
+The results, the median, 95th and 99th percentile latency and the requests per second of
+each route, are printed and written to a JSON file. The file only contains the results,
+the options and the git commit, so the files for two commits can be compared with diff.
+
+By default the in-process caches of the paralympic app are used, so the repeated
+requests measure the cached routes. Use --no-cache to measure the database queries.
+
+Usage:
+    python benchmarks/bench_http.py --events 1000 100000 1000000 --iris 150 100000 \\
+        --requests 200 --output bench_http.json
+"""
+import argparse
+import csv
+import http.client
+import json
+import logging
+import multiprocessing
+import platform
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from werkzeug.serving import make_server
+
+ROOT = Path(__file__).parents[1]
+
+ROUTES = {
+    "paralympic": ["/event", "/noc/GBR", "/"],
+    "iris": [
+        "/",
+        "/predict?sep-len=5.1&sep-wid=3.5&pet-len=1.4&pet-wid=0.2",
+        "/iris",
+    ],
+}
+
+
+def make_config(app_name, db_path, no_cache):
+    """Returns the production config for the app using the database at db_path"""
+    if app_name == "paralympic":
+        from paralympic_app import config
+    else:
+        from iris_app import config
+
+    class BenchConfig(config.ProdConfig):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + str(db_path)
+        if no_cache:
+            EVENT_CACHE_SIZE = 0
+            PAGE_CACHE_ENABLED = False
+
+    return BenchConfig
+
+
+def build_app(app_name, db_path, no_cache):
+    """Returns the app created with create_app() for the database at db_path"""
+    if app_name == "paralympic":
+        from paralympic_app import create_app
+    else:
+        from iris_app import create_app
+    return create_app(make_config(app_name, db_path, no_cache))
+
+
+def seed_iris(rows):
+    """Adds the rows of iris.csv repeated to the given number of rows"""
+    from iris_app import db
+    from iris_app.models import Iris
+
+    csv_file = ROOT.joinpath("iris_app", "data", "iris.csv")
+    with open(csv_file, newline="", encoding="utf-8-sig") as f:
+        iris = list(csv.DictReader(f))
+    for i in range(0, rows, 10000):
+        batch = [iris[j % len(iris)] for j in range(i, min(i + 10000, rows))]
+        db.session.execute(db.insert(Iris), batch)
+    db.session.commit()
+
+
+def seed(app, app_name, rows):
+    """Seeds the database of the app with the given number of rows"""
+    with app.app_context():
+        if app_name == "paralympic":
+            from bench_serializers import seed as seed_events
+            from paralympic_app import db
+
+            seed_events(rows)
+        else:
+            from iris_app import db
+
+            seed_iris(rows)
+        db.session.remove()
+        db.engine.dispose()
+
+
+def summarise(app_name, rows, driver, route, times, elapsed):
+    """Returns the result for a route as a dict"""
+    cuts = statistics.quantiles(times, n=100, method="inclusive")
+    return {
+        "app": app_name,
+        "rows": rows,
+        "driver": driver,
+        "route": route,
+        "requests": len(times),
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p95_ms": round(cuts[94] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+        "req_per_s": round(len(times) / elapsed, 1),
+    }
+
+
+def bench_test_client(app, route, requests, warmup):
+    """Returns the request times and total time of requests to a route with the test client"""
+    client = app.test_client()
+    for _ in range(warmup):
+        client.get(route)
+    times = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        request_start = time.perf_counter()
+        response = client.get(route)
+        times.append(time.perf_counter() - request_start)
+        if response.status_code != 200:
+            raise RuntimeError(f"{route} returned {response.status_code}")
+    return times, time.perf_counter() - start
+
+
+def get(port, route):
+    """Requests a route from the local server and returns the time taken"""
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    connection.request("GET", route)
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    if response.status != 200:
+        raise RuntimeError(f"{route} returned {response.status}")
+    return time.perf_counter() - start
+
+
+def bench_server(port, route, requests, warmup, concurrency):
+    """Returns the request times and total time of concurrent requests to the server"""
+    for _ in range(warmup):
+        get(port, route)
+    with ThreadPoolExecutor(concurrency) as executor:
+        start = time.perf_counter()
+        times = list(executor.map(lambda _: get(port, route), range(requests)))
+        return times, time.perf_counter() - start
+
+
+def serve(app_name, db_path, no_cache, port):
+    """Runs the app in a werkzeug threaded server until the process is terminated"""
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    app = build_app(app_name, db_path, no_cache)
+    make_server("127.0.0.1", port, app, threaded=True).serve_forever()
+
+
+def wait_for_port(port, timeout=60):
+    """Waits until a server is accepting connections on the port"""
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        try:
+            http.client.HTTPConnection("127.0.0.1", port, timeout=1).connect()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"No server on port {port}")
+
+
+def free_port():
+    """Returns a port number that isn't in use"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run(app_name, rows, options):
+    """Seeds a database and benchmarks the routes of the app, returns the results"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp).joinpath("bench.db")
+        app = build_app(app_name, db_path, options["no_cache"])
+        seed(app, app_name, rows)
+
+        for route in ROUTES[app_name]:
+            times, elapsed = bench_test_client(
+                app, route, options["requests"], options["warmup"]
+            )
+            results.append(
+                summarise(app_name, rows, "test_client", route, times, elapsed)
+            )
+
+        port = free_port()
+        server = multiprocessing.get_context("spawn").Process(
+            target=serve, args=(app_name, db_path, options["no_cache"], port)
+        )
+        server.start()
+        try:
+            wait_for_port(port)
+            for route in ROUTES[app_name]:
+                times, elapsed = bench_server(
+                    port,
+                    route,
+                    options["requests"],
+                    options["warmup"],
+                    options["concurrency"],
+                )
+                results.append(
+                    summarise(app_name, rows, "server", route, times, elapsed)
+                )
+        finally:
+            server.terminate()
+            server.join()
+    return results
+
+
+def git_commit():
+    """Returns the current git commit of the project, or None"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, nargs="*", default=[1000])
+    parser.add_argument("--iris", type=int, nargs="*", default=[150])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--output", default="bench_http.json")
+    args = parser.parse_args()
+    options = {
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "concurrency": args.concurrency,
+        "no_cache": args.no_cache,
+    }
+
+    runs = [("paralympic", rows) for rows in args.events]
+    runs += [("iris", rows) for rows in args.iris]
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for app_name, rows in runs:
+        with ProcessPoolExecutor(1, mp_context=context) as executor:
+            results += executor.submit(run, app_name, rows, options).result()
+
+    print(
+        f"{'app':<11}{'rows':>9}  {'driver':<12}{'route':<30}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}"
+    )
+    for r in results:
+        print(
+            f"{r['app']:<11}{r['rows']:>9}  {r['driver']:<12}{r['route'][:29]:<30}"
+            f"{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+            f"{r['req_per_s']:>9.1f}"
+        )
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "options": options,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compares the time to serialise all events with Marshmallow and with RowSerializer.
+
+Creates a temporary SQLite database with the events from events.csv repeated to the
+requested number of rows, then times events_schema.dump() of the ORM objects against
+event_serializer.dump() of the Core rows, including the query in both cases.
+
+Usage: python benchmarks/bench_serializers.py --rows 10000 --repeat 5
+"""
+import argparse
+import csv
+import tempfile
+import time
+from pathlib import Path
+from paralympic_app import create_app, config, db
+from paralympic_app.models import Event, Region
+
+DATA_DIR = Path(__file__).parents[1].joinpath("paralympic_app", "data")
+
+
+def read_csv(name):
+    """Returns the rows of a csv file in the data folder as dicts, with "" as None"""
+    with open(DATA_DIR.joinpath(name), newline="", encoding="utf-8-sig") as f:
+        return [
+            {k: v if v != "" else None for k, v in row.items()}
+            for row in csv.DictReader(f)
+        ]
+
+
+def seed(rows):
+    """Adds the regions and the events repeated to the given number of rows"""
+    events = read_csv("events.csv")
+    for event in events:
+        del event["event_id"]
+        # The model doesn't allow the missing values in the csv for these columns
+        event["male"] = event["male"] or 0
+        event["female"] = event["female"] or 0
+    db.session.execute(db.insert(Region), read_csv("regions.csv"))
+    db.session.execute(
+        db.insert(Event), [events[i % len(events)] for i in range(rows)]
+    )
+    db.session.commit()
+
+
+def best_time(func, repeat):
+    """Returns the fastest of repeat calls of func in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        class BenchConfig(config.TestConfig):
+            SQLALCHEMY_DATABASE_URI = "sqlite:///" + str(
+                Path(tmp).joinpath("bench.db")
+            )
+
+        app = create_app(BenchConfig)
+        with app.app_context():
+            from paralympic_app.routes import events_schema, event_serializer
+
+            seed(args.rows)
+
+            def marshmallow():
+                events = db.session.execute(db.select(Event)).scalars()
+                events_schema.dump(events)
+                db.session.expunge_all()
+
+            schema_time = best_time(marshmallow, args.repeat)
+            fast_time = best_time(event_serializer.dump, args.repeat)
+            db.session.remove()
+            db.engine.dispose()
+
+    print(f"Rows: {args.rows}")
+    print(f"Marshmallow:   {schema_time * 1000:8.1f} ms")
+    print(f"RowSerializer: {fast_time * 1000:8.1f} ms")
+    print(f"Speedup:       {schema_time / fast_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
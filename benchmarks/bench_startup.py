@@ -0,0 +1,217 @@
+"""Reports the cold-start cost of create_app() for both apps.
+
+Each app is started in a new Python process run with -X importtime, which creates the app
+with the production config over a temporary copy of its bundled database and then makes
+its first request. The report gives, for each app:
+
+- the time to import the app package, to run create_app() and to serve the first request,
+  and the peak memory (max RSS) after create_app() and after the first request
+- the import time of each top-level package imported, from -X importtime, with the
+  packages that take longest first
+
+The times are the median of --repeat runs, the import breakdown is from the first run.
+The peak memory is from the resource module, which is only on Unix. On Windows it is
+read with psutil if that is installed, and otherwise reported as n/a.
+The first request for the iris app is a prediction, so it includes loading the model
+unless the app is run with --warmup, see iris_app/prediction_model.py.
+
+Usage:
+    python benchmarks/bench_startup.py --repeat 5 --top 15 --output bench_startup.json
+"""
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+
+APPS = {
+    "paralympic": {
+        "package": "paralympic_app",
+        "database": ROOT.joinpath("paralympic_app", "data", "paralympics.db"),
+        "first_request": "/event",
+    },
+    "iris": {
+        "package": "iris_app",
+        "database": ROOT.joinpath("iris_app", "data", "iris.db"),
+        "first_request": "/predict?sep-len=5.1&sep-wid=3.5&pet-len=1.4&pet-wid=0.2",
+    },
+}
+
+# Run in the new process. Prints the timings as JSON on the last line of stdout.
+CHILD = """
+import json, sys, time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+
+
+def max_rss_mb():
+    if resource is not None:
+        # ru_maxrss is in bytes on macOS and in KiB on Linux
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    if psutil is not None:
+        # The peak working set, Windows only
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    return None
+
+
+start = time.perf_counter()
+from {package} import create_app, config
+imported = time.perf_counter()
+
+
+class StartupConfig(config.ProdConfig):
+    SQLALCHEMY_DATABASE_URI = "sqlite:///" + sys.argv[1]
+    MODEL_WARMUP = {warmup}
+
+
+app = create_app(StartupConfig)
+created = time.perf_counter()
+created_rss = max_rss_mb()
+response = app.test_client().get({first_request!r})
+requested = time.perf_counter()
+if response.status_code != 200:
+    raise RuntimeError(f"{first_request} returned {{response.status_code}}")
+print(
+    json.dumps(
+        {{
+            "import_ms": (imported - start) * 1000,
+            "create_app_ms": (created - imported) * 1000,
+            "first_request_ms": (requested - created) * 1000,
+            "create_app_max_rss_mb": created_rss,
+            "first_request_max_rss_mb": max_rss_mb(),
+        }}
+    )
+)
+"""
+
+
+def parse_importtime(stderr):
+    """Returns the total self import time in ms of each top-level package.
+
+    Each line of -X importtime output is e.g.
+    "import time:       523 |     213289 |   flask", the self and cumulative time in
+    microseconds and the module name, indented by its nesting.
+    """
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:") :].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            # The header line
+            continue
+        package = parts[2].strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(parts[0]) / 1000
+    return packages
+
+
+def run_once(app_name, warmup):
+    """Starts the app in a new process and returns the timings and import times"""
+    app = APPS[app_name]
+    child = CHILD.format(
+        package=app["package"],
+        warmup=warmup,
+        first_request=app["first_request"],
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        # A copy, as create_app() and the WAL pragma can change the database file
+        db_path = Path(tmp).joinpath(app["database"].name)
+        shutil.copy(app["database"], db_path)
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", child, str(db_path)],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        )
+    if process.returncode != 0:
+        raise RuntimeError(f"{app_name} failed to start:\n{process.stderr}")
+    timings = json.loads(process.stdout.splitlines()[-1])
+    return timings, parse_importtime(process.stderr)
+
+
+def median(values):
+    """Returns the median rounded to 0.1, or None if any value is None"""
+    if None in values:
+        return None
+    return round(statistics.median(values), 1)
+
+
+def format_mb(value):
+    """Returns a memory size in MB for the report, or n/a if it isn't known"""
+    return "n/a" if value is None else f"{value:.0f} MB"
+
+
+def run(app_name, repeat, top, warmup):
+    """Returns the median timings and the top import times for an app"""
+    runs = [run_once(app_name, warmup) for _ in range(repeat)]
+    timings = {name: median([t[name] for t, _ in runs]) for name in runs[0][0]}
+    packages = sorted(runs[0][1].items(), key=lambda p: p[1], reverse=True)
+    return {
+        "app": app_name,
+        **timings,
+        "imports_ms": {name: round(ms, 1) for name, ms in packages[:top]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--apps", nargs="*", choices=list(APPS), default=list(APPS)
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        help="number of top-level packages in the import breakdown",
+    )
+    parser.add_argument(
+        "--warmup",
+        action="store_true",
+        help="load the iris prediction model in create_app(), MODEL_WARMUP = True",
+    )
+    parser.add_argument(
+        "--output", help="also write the results to a JSON file"
+    )
+    args = parser.parse_args()
+
+    results = [
+        run(app_name, args.repeat, args.top, args.warmup)
+        for app_name in args.apps
+    ]
+    for r in results:
+        print(
+            f"{r['app']}: import {r['import_ms']:.0f} ms, create_app "
+            f"{r['create_app_ms']:.0f} ms, first request "
+            f"{r['first_request_ms']:.0f} ms, max RSS "
+            f"{format_mb(r['create_app_max_rss_mb'])} after create_app and "
+            f"{format_mb(r['first_request_max_rss_mb'])} after the first request"
+        )
+        for name, ms in r["imports_ms"].items():
+            print(f"    {name:<30}{ms:>9.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"python": sys.version.split()[0], "results": results},
+                f,
+                indent=2,
+            )
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 from pathlib import Path
 from flask import Flask
+from sqlalchemy import event
 from flask_sqlalchemy import SQLAlchemy
+from app_common.compression import init_compression
+from app_common.metrics import init_metrics
 
 
 # Iris app folder
@@ -26,6 +29,19 @@ def create_app(config_object):
     # Bind the Flask-SQLAlchemy instance to the Flask app
     db.init_app(app)
 
+    # SQLite settings for each database connection, see ProdConfig in config.py
+    if app.config.get("SQLITE_PRAGMAS"):
+        with app.app_context():
+            set_sqlite_pragmas(db.engine, app.config["SQLITE_PRAGMAS"])
+
+    # Request metrics at /metrics, see app_common/metrics.py
+    if app.config.get("METRICS_ENABLED"):
+        with app.app_context():
+            init_metrics(app, db.engine)
+
+    # gzip/deflate compression of responses
+    init_compression(app)
+
     # Include the routes from routes.py
     with app.app_context():
         from . import routes
@@ -35,4 +51,40 @@ def create_app(config_object):
 
         db.create_all()
 
+    # Load the prediction model now rather than on the first prediction, see
+    # prediction_model.py
+    if app.config.get("MODEL_WARMUP"):
+        warm_up(app)
+
     return app
+
+
+def warm_up(app):
+    """Loads the prediction model, which is otherwise loaded on the first prediction
+
+    Can be called by a server before it forks its workers, or after create_app() when
+    MODEL_WARMUP isn't set.
+
+    Args:
+    app: the Flask app returned by create_app()
+    """
+    from .routes import IRIS_MODEL
+
+    IRIS_MODEL.get()
+
+
+def set_sqlite_pragmas(engine, pragmas):
+    """Runs SQLite PRAGMA statements on every new connection made by the engine
+
+    Args:
+    engine: SQLAlchemy engine for a SQLite database
+    pragmas: dict of pragma names and values e.g. {"journal_mode": "WAL"}
+
+    """
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
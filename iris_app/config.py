@@ -15,15 +15,49 @@ class Config:
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False
+    # Compression of responses, see app_common/compression.py. Bodies smaller than the
+    # minimum size in bytes are not compressed. The cache size is the number of
+    # compressed bodies kept.
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+    COMPRESS_CACHE_SIZE = 128
+    # Request latency, SQL and response size metrics at /metrics, see
+    # app_common/metrics.py
+    METRICS_ENABLED = False
+    # Number of rows fetched from the database at a time when streaming CSV
+    STREAM_BATCH_SIZE = 1000
+    # Load the prediction model in create_app() rather than on the first prediction,
+    # see prediction_model.py
+    MODEL_WARMUP = False
 
 
 class ProdConfig(Config):
     """Production config.
 
-    Not currently implemented.
+    Tunes SQLite so that reads don't wait for writes. WAL journaling lets readers run
+    while a write is in progress, and synchronous=NORMAL only syncs at WAL checkpoints
+    rather than every commit, which is safe in WAL mode. The pragmas are run on every new
+    connection, see set_sqlite_pragmas() in __init__.py.
     """
 
-    pass
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        # Negative is in KiB, so 64MB of page cache per connection
+        "cache_size": -64000,
+        # Read the database through a 256MB memory map rather than read() calls
+        "mmap_size": 268435456,
+        # Wait up to 5 seconds for a lock rather than failing with "database is locked"
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": 10,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        # Connections are shared between the threads of the server via the pool
+        "connect_args": {"check_same_thread": False},
+    }
 
 
 class DevConfig(Config):
@@ -40,4 +74,5 @@ class TestConfig(Config):
     TESTING = True
     SQLALCHEMY_ECHO = True
     WTF_CSRF_ENABLED = False
+    METRICS_ENABLED = True
     # SERVER_NAME = "127.0.0.1:5000"
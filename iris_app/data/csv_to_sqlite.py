@@ -1,16 +1,33 @@
+import argparse
 from pathlib import Path
-import pandas as pd
-from sqlalchemy import create_engine
+from app_common.csv_loader import load_csv, report, sync_csv
+
+parser = argparse.ArgumentParser(description="Adds the csv data to iris.db")
+parser.add_argument(
+    "--sync",
+    action="store_true",
+    help="update the table to match the csv file rather than adding the rows",
+)
+args = parser.parse_args()
 
 # Define the database file name and location
 db_file = Path(__file__).parent.joinpath("iris.db")
 
-# Create a connection to file as a SQLite database (this automatically creates the file if it doesn't exist)
-engine = create_engine("sqlite:///" + str(db_file), echo=False)
+# The types of the columns, used to create the table if it doesn't exist
+dtype_iris = {
+    "sepal_length": "FLOAT",
+    "sepal_width": "FLOAT",
+    "petal_length": "FLOAT",
+    "petal_width": "FLOAT",
+    "species": "TEXT",
+}
 
-# Read the iris data to a pandas dataframe
+# Add the rows of the iris csv file to a table in the sqlite database (data/iris.db), the
+# database file is created if it doesn't exist
 iris_file = Path(__file__).parent.joinpath("iris.csv")
-iris = pd.read_csv(iris_file)
-
-# Write the data to a table in the sqlite database (data/iris.db)
-iris.to_sql("iris", engine, if_exists="append", index=False)
+if args.sync:
+    # The rows have no id, so row n of the csv file is the row with rowid n. Only the
+    # changed rows are written and rows after the end of the file are deleted.
+    report(sync_csv(db_file, "iris", iris_file, column_types=dtype_iris))
+else:
+    report(load_csv(db_file, "iris", iris_file, dtype_iris))
@@ -0,0 +1,144 @@
+"""Generates synthetic iris rows at any scale for load testing.
+
+The species are equally likely, as in iris.csv, and the four measurements of each
+species are drawn from a multivariate normal distribution with the means and covariance
+of that species in iris.csv, rounded to 1 decimal place and at least 0.1 as in the data.
+
+The rows are generated and written in chunks, so the memory used doesn't depend on the
+number of rows. The same seed always gives the same data.
+
+Usage:
+    python iris_app/data/generate_data.py --rows 1000000 --seed 1 --format sqlite \\
+        --output big_iris.db
+    python iris_app/data/generate_data.py --rows 1000000 --format csv --output iris.csv
+"""
+import argparse
+import csv
+import time
+from pathlib import Path
+import numpy as np
+from sqlalchemy import create_engine
+
+DATA_DIR = Path(__file__).parent
+
+MEASUREMENTS = ["sepal_length", "sepal_width", "petal_length", "petal_width"]
+COLUMNS = MEASUREMENTS + ["species"]
+
+
+class IrisModel:
+    """The distribution of the measurements of each species, fitted to iris.csv"""
+
+    def __init__(self):
+        with open(
+            DATA_DIR.joinpath("iris.csv"), newline="", encoding="utf-8-sig"
+        ) as f:
+            rows = list(csv.DictReader(f))
+        self.species = sorted({r["species"] for r in rows})
+        self.means = []
+        self.covariances = []
+        for species in self.species:
+            values = np.array(
+                [
+                    [float(r[m]) for m in MEASUREMENTS]
+                    for r in rows
+                    if r["species"] == species
+                ]
+            )
+            self.means.append(values.mean(axis=0))
+            self.covariances.append(np.cov(values, rowvar=False))
+
+    def generate(self, rng, count):
+        """Returns count generated rows as a list of tuples in COLUMNS order
+
+        Args:
+            rng: numpy random Generator
+            count: the number of rows
+        """
+        species = rng.integers(len(self.species), size=count)
+        values = np.empty((count, len(MEASUREMENTS)))
+        for i, (mean, covariance) in enumerate(
+            zip(self.means, self.covariances)
+        ):
+            of_species = species == i
+            values[of_species] = rng.multivariate_normal(
+                mean, covariance, size=int(of_species.sum())
+            )
+        values = np.maximum(np.round(values, 1), 0.1)
+        names = [self.species[s] for s in species.tolist()]
+        return [
+            (*measurements, name)
+            for measurements, name in zip(values.tolist(), names)
+        ]
+
+
+def generate_rows(seed, count, chunk_size):
+    """Yields lists of generated rows of at most chunk_size rows"""
+    rng = np.random.default_rng(seed)
+    model = IrisModel()
+    for start in range(0, count, chunk_size):
+        yield model.generate(rng, min(chunk_size, count - start))
+
+
+def write_csv(output, chunks):
+    """Writes the rows to a csv file with the same columns as iris.csv"""
+    written = 0
+    with open(output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            written += len(chunk)
+    return written
+
+
+def write_sqlite(output, chunks):
+    """Adds the rows to the iris table of a SQLite database, creating it if needed"""
+    # Imported here so that writing a csv file doesn't need the app's dependencies
+    from iris_app.models import db
+
+    engine = create_engine("sqlite:///" + str(output))
+    db.metadata.create_all(engine)
+    insert = "INSERT INTO iris ({}) VALUES ({})".format(
+        ", ".join(COLUMNS), ", ".join("?" * len(COLUMNS))
+    )
+    written = 0
+    for chunk in chunks:
+        # One transaction per chunk
+        with engine.begin() as connection:
+            connection.exec_driver_sql(insert, chunk)
+        written += len(chunk)
+    engine.dispose()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument(
+        "--format", choices=["sqlite", "csv"], default="sqlite"
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        required=True,
+        help="the database file for sqlite, or the csv file",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    chunks = generate_rows(args.seed, args.rows, args.chunk_size)
+    if args.format == "csv":
+        written = write_csv(args.output, chunks)
+    else:
+        written = write_sqlite(args.output, chunks)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Wrote {written} rows to {args.output} in {elapsed:.1f}s "
+        f"({written / elapsed:.0f} rows/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Lazy loading of the pickled prediction model.
+
+Unpickling the model imports scikit-learn and scipy, which is most of the time and memory
+it takes to start the app. LazyModel loads the model the first time a prediction is made
+instead, so creating the app, and routes that don't predict, don't pay for it.
+
+Set MODEL_WARMUP = True in the config to load the model in create_app() instead, e.g.
+when the app is created before a server forks its workers, so the workers share the
+loaded model and the first prediction in each isn't slow.
+"""
+import pickle
+import threading
+
+
+class LazyModel:
+    """A pickled model that is loaded on first use, see the module docstring.
+
+    Safe to use from several threads, the model is only loaded once.
+
+    Args:
+        path: the path of the pickle file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        """True if the model has been loaded"""
+        return self._model is not None
+
+    def get(self):
+        """Returns the model, loading it if it hasn't been loaded yet"""
+        model = self._model
+        if model is None:
+            with self._lock:
+                # Another thread may have loaded it while this one waited for the lock
+                if self._model is None:
+                    with open(self.path, "rb") as f:
+                        self._model = pickle.load(f)
+                model = self._model
+        return model
+
+    def predict(self, values):
+        """Returns the model's predictions for a 2D array of values"""
+        return self.get().predict(values)
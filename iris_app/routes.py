@@ -1,14 +1,22 @@
+import csv
+import io
 from pathlib import Path
-import pickle
-from flask import render_template, current_app as app, request
+from flask import (
+    render_template,
+    current_app as app,
+    request,
+    stream_with_context,
+)
 import numpy as np
 from iris_app.forms import PredictionForm, UserForm
 from iris_app import db
 from iris_app.models import Iris, User
+from iris_app.prediction_model import LazyModel
 
 
+# Loaded on the first prediction, or in create_app() if MODEL_WARMUP is set
 pickle_file = Path(__file__).parent.joinpath("data", "model_lr.pkl")
-IRIS_MODEL = pickle.load(open(pickle_file, "rb"))
+IRIS_MODEL = LazyModel(pickle_file)
 
 
 @app.route("/", methods=["GET", "POST"])
@@ -57,7 +65,8 @@ def predict():
         [sepal_length, sepal_width, petal_length, petal_width]
     )
 
-    return prediction
+    # make_prediction() returns a numpy array, which Flask can't return
+    return str(prediction)
 
 
 def make_prediction(flower_values):
@@ -85,11 +94,58 @@ def make_prediction(flower_values):
 
 @app.route("/iris")
 def iris_list():
-    """Render page with a list of all the iris entries from the database"""
+    """Render page with a list of all the iris entries from the database
+
+    If the Accept header prefers text/csv to text/html the entries are returned as CSV,
+    as for /iris.csv.
+    """
+    accept = request.accept_mimetypes
+    if accept.quality("text/csv") > accept.quality("text/html"):
+        return iris_csv()
     iris = db.session.execute(db.select(Iris)).scalars()
     return render_template("iris.html", iris_list=iris)
 
 
+@app.route("/iris.csv")
+def iris_csv():
+    """Returns all the iris entries as a CSV file with the same columns as iris.csv
+
+    The rows are fetched from the database in batches of STREAM_BATCH_SIZE and each
+    batch is sent as it is read, so the whole file is never held in memory.
+    """
+    columns = [
+        Iris.sepal_length,
+        Iris.sepal_width,
+        Iris.petal_length,
+        Iris.petal_width,
+        Iris.species,
+    ]
+    query = db.select(*columns).order_by(Iris.rowid)
+    batch_size = app.config["STREAM_BATCH_SIZE"]
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([column.name for column in columns])
+        rows = db.session.execute(
+            query.execution_options(yield_per=batch_size)
+        )
+        for batch in rows.partitions():
+            writer.writerows(batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        # The header of an empty table
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    response = app.response_class(
+        stream_with_context(generate()), mimetype="text/csv"
+    )
+    response.headers["Content-Disposition"] = "attachment; filename=iris.csv"
+    return response
+
+
 @app.route("/register", methods=["GET", "POST"])
 def register():
     """Handles user registration form."""
@@ -1,6 +1,10 @@
-from flask import Flask
+from flask import Flask, g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.schema import CreateIndex
 from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
+from app_common.compression import init_compression
+from app_common.metrics import init_metrics
 
 
 # Create a global SQLAlchemy object
@@ -23,6 +27,14 @@ def create_app(config_object):
         from . import routes
 
         db.create_all()
+        # create_all() only adds indexes when it creates a table, this adds indexes that
+        # were added to the models after the tables in the database were created
+        with db.engine.begin() as connection:
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    connection.execute(CreateIndex(index, if_not_exists=True))
+            # Full text search index for /event/search
+            create_event_search_index(connection)
 
     return app
 
@@ -31,9 +43,66 @@ def initialize_extensions(app):
     """Binds extensions to the Flask application instance (app)"""
     # Flask-SQLAlchemy
     db.init_app(app)
+    # SQLite settings for each database connection, see ProdConfig in config.py
+    if app.config.get("SQLITE_PRAGMAS"):
+        with app.app_context():
+            set_sqlite_pragmas(db.engine, app.config["SQLITE_PRAGMAS"])
+    # Count the SQL queries run by each request, see count_queries()
+    if app.config.get("COUNT_QUERIES"):
+        with app.app_context():
+            count_queries(app, db.engine)
     # Flask-Marshmallow
     ma.init_app(app)
+    # Request metrics at /metrics, see app_common/metrics.py
+    if app.config.get("METRICS_ENABLED"):
+        with app.app_context():
+            init_metrics(app, db.engine)
+    # gzip/deflate compression of responses
+    init_compression(app)
+
+
+def count_queries(app, engine):
+    """Adds the number of SQL queries run by each request to the X-Query-Count header
+
+    Used in tests to check that a route runs a fixed number of queries however many rows
+    it returns, i.e. that related rows aren't lazy loaded one at a time (N+1 queries).
+
+    Args:
+        app: the Flask app
+        engine: SQLAlchemy engine used by the app
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            g.query_count = g.get("query_count", 0) + 1
+
+    @app.before_request
+    def reset_query_count():
+        # g can be shared by several requests, e.g. in tests with an app context
+        g.query_count = 0
+
+    @app.after_request
+    def add_query_count_header(response):
+        response.headers["X-Query-Count"] = str(g.get("query_count", 0))
+        return response
+
+
+def set_sqlite_pragmas(engine, pragmas):
+    """Runs SQLite PRAGMA statements on every new connection made by the engine
+
+    Args:
+        engine: SQLAlchemy engine for a SQLite database
+        pragmas: dict of pragma names and values e.g. {"journal_mode": "WAL"}
+    """
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
 
 
 # At end to prevent circular imports
-from paralympic_app.models import Event, Region
+from paralympic_app.models import Event, Region, create_event_search_index
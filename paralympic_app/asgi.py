@@ -0,0 +1,328 @@
+"""ASGI entry point that serves the read routes of the paralympic app asynchronously.
+
+With a WSGI server each request holds a worker thread or process from when the request
+starts to arrive until the last byte of the response has been sent, so a few slow
+clients can use up all the workers. Here the socket I/O is done by an ASGI server on an
+event loop, and GET /event, /event/<id>, /noc and /noc/<code> are async views that query
+the database with SQLAlchemy's async engine over aiosqlite. Waiting for a client or for
+the database no longer ties up a thread, so one process can hold many more slow
+connections open.
+
+Every other request, including the paged, streamed and embedded forms of the read
+routes, is passed to the Flask app in a thread. Both use the same database, caches and
+table versions, so the responses are the same as from the Flask app, including the ETag,
+compression and error formats.
+
+Requires the optional packages in the "async" extra, pip install -e .[async]. Run with
+e.g.
+
+    uvicorn --factory paralympic_app.asgi:create_asgi_app
+"""
+import asyncio
+import contextvars
+import io
+import sys
+from flask import request, make_response
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from werkzeug.routing import Map, Rule
+from werkzeug.exceptions import HTTPException
+from app_common.metrics import instrument_engine
+from paralympic_app import create_app, config, set_sqlite_pragmas
+from paralympic_app.cache import conditional, get_version
+from paralympic_app.models import Region, Event
+
+
+def create_asgi_app(config_object=config.ProdConfig):
+    """Creates the Flask app and returns the ASGI app that serves it
+
+    Args:
+        config_object: the Flask config class, as for create_app()
+    """
+    return AsyncReadApp(create_app(config_object))
+
+
+class AsyncReadApp:
+    """ASGI app that serves the read routes asynchronously and all others with Flask.
+
+    Args:
+        flask_app: the Flask app from create_app()
+    """
+
+    def __init__(self, flask_app):
+        # The routes need an app context when they are first imported
+        with flask_app.app_context():
+            from paralympic_app import routes
+
+        self.flask_app = flask_app
+        self.routes = routes
+        # The same database and engine options as the Flask app, with the aiosqlite
+        # driver. The connections are pooled as the default for a file is to open a new
+        # connection, and thread, for every request.
+        url = make_url(flask_app.config["SQLALCHEMY_DATABASE_URI"])
+        self.engine = create_async_engine(
+            url.set(drivername="sqlite+aiosqlite"),
+            poolclass=AsyncAdaptedQueuePool,
+            **flask_app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+        )
+        if flask_app.config.get("SQLITE_PRAGMAS"):
+            set_sqlite_pragmas(
+                self.engine.sync_engine, flask_app.config["SQLITE_PRAGMAS"]
+            )
+        # The queries of the async views are included in the request metrics
+        if "metrics" in flask_app.extensions:
+            instrument_engine(self.engine.sync_engine)
+        self.url_map = Map(
+            [
+                Rule("/event", endpoint=self.events),
+                Rule("/event/<int:event_id>", endpoint=self.event),
+                Rule("/noc", endpoint=self.regions),
+                Rule("/noc/<code>", endpoint=self.region),
+            ]
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        environ = make_environ(scope, body)
+
+        response = None
+        if scope["method"] == "GET":
+            response = await self.read(environ)
+        if response is None:
+            await self.call_flask(environ, send)
+        else:
+            await send_response(response, send)
+
+    async def lifespan(self, receive, send):
+        """Handles the ASGI lifespan messages, closing the database connections at shutdown"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def read(self, environ):
+        """Returns the response from an async view, or None if Flask should handle the request"""
+        try:
+            view, values = self.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None
+        with self.flask_app.request_context(environ):
+            routes = self.routes
+            if (
+                routes.is_paged_request()
+                or routes.is_stream_request()
+                or routes.is_csv_request()
+                or "embed" in request.args
+            ):
+                return None
+            # Runs the before_request and after_request functions as Flask would, e.g.
+            # for compression
+            response = self.flask_app.preprocess_request()
+            if response is None:
+                response = await view(**values)
+            return self.flask_app.process_response(make_response(response))
+
+    async def call_flask(self, environ, send):
+        """Passes the request to the Flask app, which is run in a thread"""
+        loop = asyncio.get_running_loop()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = headers
+
+        def call():
+            body = self.flask_app(environ, start_response)
+            return body, iter(body)
+
+        # Flask keeps the request context in context variables, and the executor's
+        # threads each have their own. The request and every chunk of its body are run in
+        # the same context, so stream_with_context() finds the context it pushed.
+        context = contextvars.copy_context()
+        body, chunks = await loop.run_in_executor(None, context.run, call)
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": started["status"],
+                    "headers": encode_headers(started["headers"]),
+                }
+            )
+            # Each chunk is read in a thread as a streamed response may query the database
+            while True:
+                chunk = await loop.run_in_executor(
+                    None, context.run, next, chunks, None
+                )
+                if chunk is None:
+                    break
+                if chunk:
+                    message = {"body": chunk, "more_body": True}
+                    await send({"type": "http.response.body", **message})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(body, "close"):
+                await loop.run_in_executor(None, context.run, body.close)
+
+    async def fetch(self, query):
+        """Executes a select statement with the async engine and returns the rows"""
+        async with self.engine.connect() as connection:
+            result = await connection.execute(query)
+            return result.all()
+
+    # -----------
+    # Async views
+    # -----------
+    # The same as the GET routes for these URLs in routes.py, without paging and streaming
+
+    @conditional("event", "region")
+    async def events(self):
+        """Returns the details for all events"""
+        routes = self.routes
+        try:
+            serializer = routes.get_serializer(routes.event_serializer)
+            filters = routes.get_event_filters()
+        except ValueError as e:
+            return routes.error_response(400, "Bad request", str(e))
+
+        key = (
+            "events",
+            tuple(serializer.names),
+            filters,
+            get_version("event", "region"),
+        )
+        result = routes.event_cache.get(key)
+        if result is None:
+            query = routes.filter_events(serializer.select(), filters)
+            result = serializer.dump_rows(await self.fetch(query))
+            routes.event_cache.set(key, result)
+        return json_response(result)
+
+    @conditional("event", "region")
+    async def event(self, event_id):
+        """Returns the details for a specified event"""
+        routes = self.routes
+        try:
+            serializer = routes.get_serializer(routes.event_serializer)
+        except ValueError as e:
+            return routes.error_response(400, "Bad request", str(e))
+
+        key = (
+            "event",
+            event_id,
+            tuple(serializer.names),
+            get_version("event", "region"),
+        )
+        result = routes.event_cache.get(key)
+        if result is None:
+            query = serializer.select().where(Event.event_id == event_id)
+            rows = await self.fetch(query)
+            # Same as the Flask route when the event doesn't exist
+            result = serializer.dump_row(rows[0]) if rows else {}
+            routes.event_cache.set(key, result)
+        return json_response(result)
+
+    @conditional("region")
+    async def regions(self):
+        """Returns a list of NOC region codes and their details"""
+        routes = self.routes
+        try:
+            serializer = routes.get_serializer(routes.region_serializer)
+        except ValueError as e:
+            return routes.error_response(400, "Bad request", str(e))
+        rows = await self.fetch(serializer.select())
+        return json_response(serializer.dump_rows(rows))
+
+    @conditional("region", "event")
+    async def region(self, code):
+        """Returns the details for a given region code"""
+        serializer = self.routes.region_serializer
+        rows = await self.fetch(serializer.select().where(Region.NOC == code))
+        if not rows:
+            return self.routes.error_response(
+                404, "Not found", "Invalid resource URI"
+            )
+        return json_response(serializer.dump_row(rows[0]))
+
+
+def json_response(result):
+    """Returns a 200 response with the JSON of result, as used by the routes"""
+    response = make_response(result, 200)
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+def make_environ(scope, body):
+    """Returns the WSGI environ for an ASGI HTTP request
+
+    Args:
+        scope: the ASGI connection scope
+        body: the request body as bytes
+    """
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        value = value.decode("latin-1")
+        if name in environ:
+            value = environ[name] + "," + value
+        environ[name] = value
+    # The whole body has been received, so its length is known even if it was chunked
+    environ["CONTENT_LENGTH"] = str(len(body))
+    environ.pop("HTTP_TRANSFER_ENCODING", None)
+    return environ
+
+
+def encode_headers(headers):
+    """Returns a list of WSGI (name, value) headers in the ASGI format"""
+    return [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in headers
+    ]
+
+
+async def send_response(response, send):
+    """Sends a Flask response that isn't streamed to the ASGI server"""
+    headers = encode_headers(response.headers.to_wsgi_list())
+    await send(
+        {
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": headers,
+        }
+    )
+    await send({"type": "http.response.body", "body": response.get_data()})
@@ -0,0 +1,238 @@
+"""In-process caching helpers for the paralympic app.
+
+The data only changes through the write routes in routes.py, so each table has a version
+counter that those routes bump after a commit. Anything derived from a table can then be
+reused for as long as the version of the table it was built from is unchanged.
+
+NB: The counters are per process. If the app is run with several worker processes then a
+write only bumps the version in the worker that handled it.
+"""
+import hashlib
+import inspect
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from flask import request, make_response, session, current_app
+
+
+# Changes every time the app is started so that an ETag issued before a restart, when the
+# counters were reset to 0, never matches a version issued after it.
+_BOOT_ID = uuid.uuid4().hex[:8]
+
+_lock = threading.Lock()
+_versions = {"event": 0, "region": 0}
+_last_modified = {table: time.time() for table in _versions}
+
+
+def bump_version(table):
+    """Records that the contents of a table have changed.
+
+    Args:
+        table: the table name, "event" or "region"
+    """
+    with _lock:
+        _versions[table] += 1
+        _last_modified[table] = time.time()
+
+
+def get_version(*tables):
+    """Returns a tuple of the current versions of the given tables"""
+    return tuple(_versions[table] for table in tables)
+
+
+def get_last_modified(*tables):
+    """Returns the time (seconds since the epoch) of the last change to any of the tables"""
+    return max(_last_modified[table] for table in tables)
+
+
+def make_etag(tables, key):
+    """Returns a strong ETag for a resource built from the given tables.
+
+    Args:
+        tables: the names of the tables the resource is built from
+        key: identifies the resource, e.g. the request path and query string
+    """
+    versions = "-".join(str(v) for v in get_version(*tables))
+    digest = hashlib.md5(key.encode()).hexdigest()[:12]
+    return f"{_BOOT_ID}-{versions}-{digest}"
+
+
+class LRUCache:
+    """A thread-safe least recently used cache with an optional time to live.
+
+    Args:
+        maxsize: the maximum number of entries, the least recently used entry is evicted
+            when a new entry would exceed this. 0 disables the cache.
+        ttl: the number of seconds an entry is valid for, None for no expiry
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Returns the value for key, or default if it is not cached or has expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (
+                entry[1] is None or entry[1] > time.monotonic()
+            ):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """Adds or replaces the value for key, evicting the least recently used entry if full"""
+        if self.maxsize <= 0:
+            return
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, func):
+        """Returns the cached value for key, calling func() to create and cache it on a miss"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = func()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, *keys):
+        """Removes the given keys from the cache"""
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def invalidate_matching(self, predicate):
+        """Removes all the keys for which predicate(key) is true"""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        """Removes all entries from the cache"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Returns a dict of the size of the cache and the hit, miss and eviction counts"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
+
+
+def cached_view(cache, *tables):
+    """Decorator that caches the output of a route that renders a template.
+
+    The output is cached by the route and its arguments and the current versions of the
+    given tables, so a write to any of the tables means the page is rendered again. The
+    cache isn't used if PAGE_CACHE_ENABLED is False or if there are flashed messages to
+    show, as these are only shown once.
+
+    Args:
+        cache: the LRUCache to store the pages in
+        tables: the names of the tables the page is built from
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.config["PAGE_CACHE_ENABLED"] or session.get(
+                "_flashes"
+            ):
+                return view(*args, **kwargs)
+            key = (
+                request.endpoint,
+                tuple(sorted(kwargs.items())),
+                get_version(*tables),
+            )
+            return cache.get_or_set(key, lambda: view(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
+
+
+def conditional(*tables):
+    """Decorator that adds conditional GET support to a route.
+
+    The response gets an ETag and Last-Modified header derived from the versions of the
+    given tables. If the ETag in the request If-None-Match header still matches then a
+    304 Not Modified response is returned without calling the route, so neither the
+    database nor the Marshmallow schemas are used.
+
+    The route can also be a coroutine function, as used by asgi.py.
+
+    Args:
+        tables: the names of the tables the route reads from
+    """
+
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                etag = _request_etag(tables)
+                if request.if_none_match.contains_weak(etag):
+                    response = make_response("", 304)
+                else:
+                    response = make_response(await view(*args, **kwargs))
+                return _add_validators(response, etag, tables)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = _request_etag(tables)
+            # If-None-Match uses weak comparison, so this also matches the weak ETag
+            # of a compressed response, see app_common/compression.py
+            if request.if_none_match.contains_weak(etag):
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            return _add_validators(response, etag, tables)
+
+        return wrapper
+
+    return decorator
+
+
+def _request_etag(tables):
+    """Returns the ETag for the current request, see conditional()"""
+    # The Accept header can change the format of the response
+    key = request.full_path + request.headers.get("Accept", "")
+    return make_etag(tables, key)
+
+
+def _add_validators(response, etag, tables):
+    """Adds the ETag and Last-Modified headers to a 200 or 304 response"""
+    if response.status_code not in (200, 304):
+        return response
+    response.set_etag(etag)
+    response.last_modified = get_last_modified(*tables)
+    response.vary.add("Accept")
+    return response
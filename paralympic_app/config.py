@@ -14,12 +14,60 @@ class Config:
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False
+    # Compression of responses, see app_common/compression.py. Bodies smaller than the
+    # minimum size in bytes are not compressed. The cache size is the number of
+    # compressed bodies kept.
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+    COMPRESS_CACHE_SIZE = 128
+    # Request latency, SQL and response size metrics at /metrics, see
+    # app_common/metrics.py
+    METRICS_ENABLED = False
+    # Default and maximum number of rows in a page of API results
+    PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+    # Cache of serialised events used by get_events() and get_event().
+    # Maximum number of entries (0 to disable) and time to live in seconds (None for no expiry)
+    EVENT_CACHE_SIZE = 1024
+    EVENT_CACHE_TTL = 300
+    # Cache of the rendered HTML pages, and the maximum number of pages in it
+    PAGE_CACHE_ENABLED = True
+    PAGE_CACHE_SIZE = 256
+    # Maximum radius in km of a search for events near a point
+    NEAR_MAX_RADIUS_KM = 5000
+    # Maximum number of records in a request to a /bulk route
+    BULK_MAX_ROWS = 10000
+    # Number of rows fetched from the database at a time when streaming NDJSON
+    STREAM_BATCH_SIZE = 1000
 
 
 class ProdConfig(Config):
-    """Production config not currently implemented."""
+    """Production config.
 
-    pass
+    Tunes SQLite so that reads don't wait for writes. WAL journaling lets readers run
+    while a write is in progress, and synchronous=NORMAL only syncs at WAL checkpoints
+    rather than every commit, which is safe in WAL mode. The pragmas are run on every new
+    connection, see set_sqlite_pragmas() in __init__.py.
+    """
+
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        # Negative is in KiB, so 64MB of page cache per connection
+        "cache_size": -64000,
+        # Read the database through a 256MB memory map rather than read() calls
+        "mmap_size": 268435456,
+        # Wait up to 5 seconds for a lock rather than failing with "database is locked"
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": 10,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        # Connections are shared between the threads of the server via the pool
+        "connect_args": {"check_same_thread": False},
+    }
 
 
 class DevConfig(Config):
@@ -36,4 +84,7 @@ class TestConfig(Config):
     TESTING = True
     SQLALCHEMY_ECHO = False
     WTF_CSRF_ENABLED = False
+    # Adds the number of SQL queries run to each response, see count_queries()
+    COUNT_QUERIES = True
+    METRICS_ENABLED = True
     # SERVER_NAME = "127.0.0.1:5000"
@@ -1,17 +1,23 @@
+import argparse
 from pathlib import Path
-import pandas as pd
-from sqlalchemy import create_engine, types
+from app_common.csv_loader import load_csv, report, sync_csv
+
+parser = argparse.ArgumentParser(
+    description="Adds the csv data to paralympics.db"
+)
+parser.add_argument(
+    "--sync",
+    action="store_true",
+    help="update the tables to match the csv files rather than adding the rows",
+)
+args = parser.parse_args()
 
 
 # Define the database file name and location
 db_file = Path(__file__).parent.joinpath("paralympics.db")
 
-# Create a connection to file as a SQLite database (this automatically creates the file if it doesn't exist)
-engine = create_engine("sqlite:///" + str(db_file), echo=False)
-
-# Read the noc_regions data to a pandas dataframe
-# The following avoids an issue whereby entries with "NA" in the csv file are treated as
-# null values rather than valid text 'NA' which is what we want
+# Values in the csv files that are stored as null. "NA" is not included as it is a valid
+# region code, 'NA' as text is what we want
 na_values = [
     "",
     "#N/A",
@@ -31,44 +37,50 @@ na_values = [
     "nan",
     "null",
 ]
-noc_file = Path(__file__).parent.joinpath("regions.csv")
-# Read the data and handles the NA issue
-noc_regions = pd.read_csv(noc_file, keep_default_na=False, na_values=na_values)
 
-# Read the paralympics event data to a pandas dataframe
-event_file = Path(__file__).parent.joinpath("events.csv")
-paralympics = pd.read_csv(event_file)
-
-# Write the data to tables in a sqlite database
+# The types of the columns, used to create the tables if they don't exist
 dtype_noc = {
-    "event_id": types.INTEGER(),
-    "type": types.TEXT(),
-    "year": types.INTEGER(),
-    "location": types.TEXT(),
-    "lat": types.FLOAT(),
-    "lon": types.FLOAT(),
-    "NOC": types.TEXT(),
-    "start": types.TEXT(),
-    "end": types.TEXT(),
-    "disabilities_included": types.TEXT(),
-    "events": types.INTEGER(),
-    "sports": types.INTEGER(),
-    "countries": types.INTEGER(),
-    "male": types.INTEGER(),
-    "female": types.INTEGER(),
-    "participants": types.INTEGER(),
-    "highlights": types.TEXT(),
+    "NOC": "TEXT",
+    "region": "TEXT",
+    "notes": "TEXT",
 }
 
 dtype_event = {
-    "NOC": types.TEXT(),
-    "region": types.TEXT(),
-    "notes": types.TEXT(),
+    "event_id": "INTEGER",
+    "type": "TEXT",
+    "year": "INTEGER",
+    "location": "TEXT",
+    "lat": "FLOAT",
+    "lon": "FLOAT",
+    "NOC": "TEXT",
+    "start": "TEXT",
+    "end": "TEXT",
+    "disabilities_included": "TEXT",
+    "events": "INTEGER",
+    "sports": "INTEGER",
+    "countries": "INTEGER",
+    "male": "INTEGER",
+    "female": "INTEGER",
+    "participants": "INTEGER",
+    "highlights": "TEXT",
 }
 
-noc_regions.to_sql(
-    "region", engine, if_exists="append", index=False, dtype=dtype_noc
-)
-paralympics.to_sql(
-    "event", engine, if_exists="append", index=False, dtype=dtype_event
-)
+# Add the rows of the csv files to tables in a sqlite database (this automatically
+# creates the file if it doesn't exist). The files are read in chunks, so large files
+# can be loaded too.
+noc_file = Path(__file__).parent.joinpath("regions.csv")
+event_file = Path(__file__).parent.joinpath("events.csv")
+if args.sync:
+    # Only the new and changed rows are written and rows no longer in the files are
+    # deleted, so this can be run after each change to the csv files
+    report(
+        sync_csv(db_file, "region", noc_file, ["NOC"], dtype_noc, na_values)
+    )
+    report(
+        sync_csv(
+            db_file, "event", event_file, ["event_id"], dtype_event, na_values
+        )
+    )
+else:
+    report(load_csv(db_file, "region", noc_file, dtype_noc, na_values))
+    report(load_csv(db_file, "event", event_file, dtype_event, na_values))
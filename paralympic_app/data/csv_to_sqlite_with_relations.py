@@ -1,6 +1,6 @@
 from pathlib import Path
 import sqlite3
-import pandas as pd
+from app_common.csv_loader import load_csv, report
 
 # ---------------------------------------------
 # Define and create the database using sqlite3
@@ -50,11 +50,14 @@ cursor.execute(create_event_table)
 # Commit the changes
 connection.commit()
 
-# -------------------------
-# Add the data using pandas
-# -------------------------
+# close the database connection
+connection.close()
 
-# Read the noc_regions data to a pandas dataframe
+# -----------------------------
+# Add the data using the loader
+# -----------------------------
+
+# Values in the csv files that are stored as null, "NA" is a valid region code
 na_values = [
     "",
     "#N/A",
@@ -74,21 +77,10 @@ na_values = [
     "nan",
     "null",
 ]
+
+# Add the rows of the csv files to the tables, each file in one transaction
 noc_file = Path(__file__).parent.joinpath("regions.csv")
-noc_regions = pd.read_csv(noc_file, keep_default_na=False, na_values=na_values)
+report(load_csv(db_file, "region", noc_file, null_values=na_values))
 
-# Read the paralympics event data to a pandas dataframe
 event_file = Path(__file__).parent.joinpath("events.csv")
-paralympics = pd.read_csv(event_file)
-
-# Write the data to tables in a sqlite database
-noc_regions.to_sql(
-    "region",
-    connection,
-    if_exists="append",
-    index=False,
-)
-paralympics.to_sql("event", connection, if_exists="append", index=False)
-
-# close the database connection
-connection.close()
+report(load_csv(db_file, "event", event_file, null_values=na_values))
@@ -0,0 +1,344 @@
+"""Generates synthetic regions and events at any scale for load testing.
+
+The values are modelled on events.csv and regions.csv so that they are plausible:
+
+- type is Summer or Winter in the same proportion as events.csv, and the year is every
+  four years back from 12 years after the last games of that type to the first
+- the host location, lat and lon are those of a real host city, with a small jitter, and
+  the NOC is the host's in most events and any region in the rest
+- events, sports, countries and participants follow a straight line fit against the year
+  for each type, plus normally distributed noise of the size seen in the data, and the
+  participants are split into male and female in the same way
+- start is within the months the games of that type are held, and they last 6-11 days
+- disabilities_included and highlights are taken from real events of the same type
+
+The regions are those in regions.csv plus the given number of extra regions with
+generated codes. The rows are generated and written in chunks, so the memory used
+doesn't depend on the number of events. The same seed always gives the same data.
+
+Usage:
+    python paralympic_app/data/generate_data.py --events 1000000 --seed 1 \\
+        --format sqlite --output big.db
+    python paralympic_app/data/generate_data.py --events 1000000 --regions 1000 \\
+        --format csv --output big_data/
+"""
+import argparse
+import csv
+import itertools
+import string
+import time
+from datetime import date
+from pathlib import Path
+import numpy as np
+from sqlalchemy import create_engine, func, select
+
+DATA_DIR = Path(__file__).parent
+
+EVENT_COLUMNS = [
+    "event_id",
+    "type",
+    "year",
+    "location",
+    "lat",
+    "lon",
+    "NOC",
+    "start",
+    "end",
+    "disabilities_included",
+    "events",
+    "sports",
+    "countries",
+    "male",
+    "female",
+    "participants",
+    "highlights",
+]
+REGION_COLUMNS = ["NOC", "region", "notes"]
+
+# The months in which the games of each type start
+START_MONTHS = {"Summer": (6, 11), "Winter": (1, 3)}
+# Proportion of events hosted by a random region rather than the host city's region
+OTHER_HOST_RATE = 0.2
+
+
+def read_csv(name):
+    """Returns the rows of a csv file in this folder as dicts, with "" as None"""
+    with open(DATA_DIR.joinpath(name), newline="", encoding="utf-8-sig") as f:
+        return [
+            {k: v if v != "" else None for k, v in row.items()}
+            for row in csv.DictReader(f)
+        ]
+
+
+def generated_codes(existing):
+    """Yields three or more letter region codes that are not in existing, in order"""
+    for length in itertools.count(3):
+        for letters in itertools.product(
+            string.ascii_uppercase, repeat=length
+        ):
+            code = "".join(letters)
+            if code not in existing:
+                yield code
+
+
+def generate_regions(extra):
+    """Returns the regions in regions.csv plus the given number of generated regions"""
+    regions = read_csv("regions.csv")
+    codes = generated_codes({r["NOC"] for r in regions})
+    for code in itertools.islice(codes, extra):
+        regions.append(
+            {"NOC": code, "region": f"Region {code}", "notes": None}
+        )
+    return regions
+
+
+MONTH_NAMES = [date(2000, m, 1).strftime("%b") for m in range(1, 13)]
+NUMBER_COLUMNS = ("events", "sports", "countries", "participants")
+
+
+class EventModel:
+    """The distributions of the event columns for each type, fitted to events.csv
+
+    The columns are generated a chunk at a time with numpy, each array indexed by the
+    position of the type in self.types.
+    """
+
+    def __init__(self):
+        events = read_csv("events.csv")
+        self.types = sorted({e["type"] for e in events})
+        self.type_p = np.array(
+            [sum(e["type"] == t for e in events) for t in self.types]
+        ) / len(events)
+        hosts = [e for e in events if e["lat"]]
+        self.locations = [e["location"] for e in hosts]
+        self.lat = np.array([float(e["lat"]) for e in hosts])
+        self.lon = np.array([float(e["lon"]) for e in hosts])
+        self.host_nocs = [e["NOC"] for e in hosts]
+
+        self.years = []
+        self.fits = {column: [] for column in NUMBER_COLUMNS}
+        self.fits["female_share"] = []
+        self.start_months = []
+        self.disabilities = []
+        self.highlights = []
+        for t in self.types:
+            rows = [e for e in events if e["type"] == t]
+            years = np.array([int(e["year"]) for e in rows])
+            self.years.append(np.arange(years.max() + 12, years.min() - 1, -4))
+            for column in NUMBER_COLUMNS:
+                values = np.array([float(e[column]) for e in rows])
+                self.fits[column].append(fit_line(years, values))
+            with_sexes = [e for e in rows if e["male"] and e["female"]]
+            female_share = [
+                int(e["female"]) / (int(e["male"]) + int(e["female"]))
+                for e in with_sexes
+            ]
+            self.fits["female_share"].append(
+                fit_line(
+                    np.array([int(e["year"]) for e in with_sexes]),
+                    np.array(female_share),
+                )
+            )
+            self.start_months.append(START_MONTHS.get(t, (1, 12)))
+            self.disabilities.append(
+                [e["disabilities_included"] for e in rows]
+            )
+            self.highlights.append([e["highlights"] for e in rows])
+
+    def generate(self, rng, first_id, count, nocs):
+        """Returns count generated events as a list of tuples in EVENT_COLUMNS order
+
+        Args:
+            rng: numpy random Generator
+            first_id: the event_id of the first event
+            count: the number of events
+            nocs: list of the region codes the events can be hosted by
+        """
+        types = rng.choice(len(self.types), size=count, p=self.type_p)
+        picks = rng.random(size=(count, 4))
+        year = np.empty(count, dtype=np.int64)
+        start_month = np.empty(count, dtype=np.int64)
+        month_span = np.empty(count, dtype=np.int64)
+        for i, years in enumerate(self.years):
+            of_type = types == i
+            year[of_type] = years[(picks[of_type, 0] * len(years)).astype(int)]
+            first, last = self.start_months[i]
+            start_month[of_type] = first
+            month_span[of_type] = last - first + 1
+
+        values = {}
+        for column, fits in self.fits.items():
+            a, b, sd = (np.array(f)[types] for f in zip(*fits))
+            values[column] = a * year + b + sd * rng.standard_normal(count)
+        participants = np.maximum(np.rint(values["participants"]), 2)
+        share = np.clip(values["female_share"], 0.05, 0.6)
+        female = np.rint(participants * share)
+
+        hosts = rng.integers(len(self.locations), size=count)
+        other_host = rng.random(count) < OTHER_HOST_RATE
+        other_nocs = rng.integers(len(nocs), size=count)
+        lat = np.round(self.lat[hosts] + rng.normal(0, 0.05, count), 4)
+        lon = np.round(self.lon[hosts] + rng.normal(0, 0.05, count), 4)
+
+        # Days since the epoch of the start and end dates, which are then formatted
+        # as in events.csv, e.g. 18-Sep-60
+        first_day = (
+            ((year - 1970) * 12 + start_month - 1)
+            .astype("datetime64[M]")
+            .astype("datetime64[D]")
+        )
+        span_days = ((year - 1970) * 12 + start_month - 1 + month_span).astype(
+            "datetime64[M]"
+        ).astype("datetime64[D]") - first_day
+        start = first_day + (picks[:, 1] * span_days.astype(int)).astype(int)
+        end = start + rng.integers(6, 12, size=count)
+
+        columns = [
+            range(first_id, first_id + count),
+            [self.types[t] for t in types],
+            year.tolist(),
+            [self.locations[h] for h in hosts],
+            lat.tolist(),
+            lon.tolist(),
+            [
+                nocs[o] if other else self.host_nocs[h]
+                for h, other, o in zip(hosts, other_host, other_nocs)
+            ],
+            format_dates(start),
+            format_dates(end),
+            pick(self.disabilities, types, picks[:, 2]),
+            np.maximum(np.rint(values["events"]), 1).astype(int).tolist(),
+            np.maximum(np.rint(values["sports"]), 1).astype(int).tolist(),
+            np.maximum(np.rint(values["countries"]), 1).astype(int).tolist(),
+            (participants - female).astype(int).tolist(),
+            female.astype(int).tolist(),
+            participants.astype(int).tolist(),
+            pick(self.highlights, types, picks[:, 3]),
+        ]
+        return list(zip(*columns))
+
+
+def fit_line(x, y):
+    """Fits y = a * x + b and returns a, b and the standard deviation of the residuals"""
+    a, b = np.polyfit(x, y, 1)
+    return a, b, np.std(y - (a * x + b))
+
+
+def pick(choices, types, u):
+    """Returns the choice at fraction u of the way through the choices for each type"""
+    return [
+        choices[t][int(f * len(choices[t]))] for t, f in zip(types.tolist(), u)
+    ]
+
+
+def format_dates(days):
+    """Formats an array of datetime64[D] as in events.csv, e.g. 18-Sep-60"""
+    ymd = days.astype(object)
+    return [
+        f"{d.day:02d}-{MONTH_NAMES[d.month - 1]}-{d.year % 100:02d}"
+        for d in ymd
+    ]
+
+
+def generate_events(seed, count, first_id, nocs, chunk_size):
+    """Yields lists of generated events of at most chunk_size events"""
+    rng = np.random.default_rng(seed)
+    model = EventModel()
+    for start in range(0, count, chunk_size):
+        size = min(chunk_size, count - start)
+        yield model.generate(rng, first_id + start, size, nocs)
+
+
+def write_csv(output, regions, events):
+    """Writes regions.csv and events.csv in the output folder"""
+    output.mkdir(parents=True, exist_ok=True)
+    with open(output.joinpath("regions.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(REGION_COLUMNS)
+        writer.writerows([r[c] for c in REGION_COLUMNS] for r in regions)
+    written = 0
+    with open(output.joinpath("events.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(EVENT_COLUMNS)
+        for chunk in events(1):
+            writer.writerows(chunk)
+            written += len(chunk)
+    return written
+
+
+def write_sqlite(output, regions, events):
+    """Adds the regions and events to a SQLite database, creating the tables if needed.
+
+    Regions that are already in the database are left as they are and the events are
+    added after any existing events.
+    """
+    # Imported here so that writing csv files doesn't need the app's dependencies
+    from paralympic_app.models import Event, Region, db
+
+    engine = create_engine("sqlite:///" + str(output))
+    db.metadata.create_all(engine)
+    written = 0
+    with engine.begin() as connection:
+        connection.execute(
+            Region.__table__.insert().prefix_with("OR IGNORE"), regions
+        )
+        last_id = connection.execute(select(func.max(Event.event_id))).scalar()
+    # The rows are tuples, so insert them with the driver's executemany rather than
+    # converting each to a dict for a SQLAlchemy insert
+    insert = "INSERT INTO event ({}) VALUES ({})".format(
+        ", ".join(f'"{c}"' for c in EVENT_COLUMNS),
+        ", ".join("?" * len(EVENT_COLUMNS)),
+    )
+    for chunk in events((last_id or 0) + 1):
+        # One transaction per chunk
+        with engine.begin() as connection:
+            connection.exec_driver_sql(insert, chunk)
+        written += len(chunk)
+    engine.dispose()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument(
+        "--regions",
+        type=int,
+        default=0,
+        help="number of generated regions in addition to those in regions.csv",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument(
+        "--format", choices=["sqlite", "csv"], default="sqlite"
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        required=True,
+        help="the database file for sqlite, or the folder for csv",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    regions = generate_regions(args.regions)
+    nocs = [r["NOC"] for r in regions]
+
+    def events(first_id):
+        return generate_events(
+            args.seed, args.events, first_id, nocs, args.chunk_size
+        )
+
+    if args.format == "csv":
+        written = write_csv(args.output, regions, events)
+    else:
+        written = write_sqlite(args.output, regions, events)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Wrote {len(regions)} regions and {written} events to {args.output} "
+        f"in {elapsed:.1f}s ({written / elapsed:.0f} events/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
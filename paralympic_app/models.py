@@ -1,5 +1,38 @@
+from sqlalchemy.ext.hybrid import hybrid_property
 from paralympic_app import db
 
+# Event locations are indexed on a grid of cells of 1 degree of latitude by 1 degree of
+# longitude, see Event.grid_cell. There are 361 columns so that longitude 180 has a
+# column of its own rather than sharing the first column of the next row.
+GRID_COLUMNS = 361
+
+
+def grid_cell_ranges(lat_min, lat_max, lon_min, lon_max):
+    """Returns the ranges of grid cell numbers that cover a bounding box
+
+    There is one (first, last) range for each row of cells, so each range can be found
+    with the index on the grid cell.
+    """
+    first_column = int(lon_min + 180)
+    last_column = int(lon_max + 180)
+    return [
+        (row * GRID_COLUMNS + first_column, row * GRID_COLUMNS + last_column)
+        for row in range(int(lat_min + 90), int(lat_max + 90) + 1)
+    ]
+
+
+def grid_cell_expression(lat, lon):
+    """Returns the SQL expression for the grid cell of the lat and lon columns
+
+    Uses literal columns rather than bound parameters so that the SQL is the same in the
+    index and in queries, which SQLite needs to use an index on an expression.
+    """
+    return db.cast(
+        lat + db.literal_column("90"), db.Integer
+    ) * db.literal_column(str(GRID_COLUMNS)) + db.cast(
+        lon + db.literal_column("180"), db.Integer
+    )
+
 
 class Region(db.Model):
     """NOC region"""
@@ -8,7 +41,9 @@ class Region(db.Model):
     NOC = db.Column(db.Text, primary_key=True)
     region = db.Column(db.Text, nullable=False)
     notes = db.Column(db.Text)
-    events = db.relationship("Event", back_populates="region")
+    events = db.relationship(
+        "Event", back_populates="region", order_by="Event.event_id"
+    )
 
     def __repr__(self):
         """
@@ -24,12 +59,14 @@ class Event(db.Model):
 
     __tablename__ = "event"
     event_id = db.Column(db.Integer, primary_key=True)
-    type = db.Column(db.Text, nullable=False)
-    year = db.Column(db.Integer, nullable=False)
+    type = db.Column(db.Text, nullable=False, index=True)
+    year = db.Column(db.Integer, nullable=False, index=True)
     location = db.Column(db.Text, nullable=False)
-    lat = db.Column(db.Text)
-    lon = db.Column(db.Text)
-    NOC = db.Column(db.Text, db.ForeignKey("region.NOC"), nullable=False)
+    lat = db.Column(db.Float)
+    lon = db.Column(db.Float)
+    NOC = db.Column(
+        db.Text, db.ForeignKey("region.NOC"), nullable=False, index=True
+    )
     start = db.Column(db.Text, nullable=False)
     end = db.Column(db.Text, nullable=False)
     disabilities_included = db.Column(db.Text, nullable=False)
@@ -41,6 +78,25 @@ class Event(db.Model):
     participants = db.Column(db.Integer, nullable=False)
     highlights = db.Column(db.Text)
     region = db.relationship("Region", back_populates="events")
+    # An index on the grid cell expression rather than a stored column, so the grid cell
+    # is always in step with lat and lon however the event is written
+    __table_args__ = (
+        db.Index("ix_event_grid_cell", grid_cell_expression(lat, lon)),
+    )
+
+    @hybrid_property
+    def grid_cell(self):
+        """The number of the grid cell that contains the event location
+
+        Cells are numbered row by row from latitude -90 and longitude -180.
+        """
+        if self.lat is None or self.lon is None:
+            return None
+        return int(self.lat + 90) * GRID_COLUMNS + int(self.lon + 180)
+
+    @grid_cell.expression
+    def grid_cell(cls):
+        return grid_cell_expression(cls.lat, cls.lon)
 
     def __repr__(self):
         """
@@ -52,3 +108,53 @@ class Event(db.Model):
             {self.NOC}, {self.start}, {self.end}, {self.disabilities_included}, {self.events}, \
                 {self.sports}, {self.countries}, {self.male}, {self.female}, {self.participants},\
                      {self.highlights}>"
+
+
+# ------------------
+# Full text search
+# ------------------
+
+# SQLite FTS5 index of the text columns of the event table. It is an external content
+# table, so it stores only the index and reads the text from the event table, and is
+# kept up to date by triggers on the event table whichever way an event is written.
+# It isn't part of db.metadata as create_all() can't create virtual tables.
+EVENT_SEARCH_COLUMNS = ("location", "disabilities_included", "highlights")
+event_fts = db.table(
+    "event_fts",
+    db.column("rowid", db.Integer),
+    db.column("event_fts"),
+    *(db.column(name) for name in EVENT_SEARCH_COLUMNS),
+)
+
+
+def create_event_search_index(connection):
+    """Creates the event_fts table and its triggers if they don't exist.
+
+    When the table is created it is filled with the existing events.
+
+    Args:
+        connection: SQLAlchemy connection to the paralympics database
+    """
+    exists = connection.execute(
+        db.text("SELECT 1 FROM sqlite_master WHERE name = 'event_fts'")
+    ).first()
+    if exists:
+        return
+    columns = ", ".join(EVENT_SEARCH_COLUMNS)
+    new_values = ", ".join(f"new.{name}" for name in EVENT_SEARCH_COLUMNS)
+    old_values = ", ".join(f"old.{name}" for name in EVENT_SEARCH_COLUMNS)
+    delete_old = f"""INSERT INTO event_fts(event_fts, rowid, {columns})
+        VALUES ('delete', old.event_id, {old_values});"""
+    insert_new = f"""INSERT INTO event_fts(rowid, {columns})
+        VALUES (new.event_id, {new_values});"""
+    statements = [
+        f"""CREATE VIRTUAL TABLE event_fts USING fts5(
+            {columns}, content='event', content_rowid='event_id')""",
+        f"CREATE TRIGGER event_fts_insert AFTER INSERT ON event BEGIN {insert_new} END",
+        f"CREATE TRIGGER event_fts_delete AFTER DELETE ON event BEGIN {delete_old} END",
+        f"""CREATE TRIGGER event_fts_update AFTER UPDATE ON event BEGIN
+            {delete_old} {insert_new} END""",
+        "INSERT INTO event_fts(event_fts) VALUES ('rebuild')",
+    ]
+    for statement in statements:
+        connection.execute(db.text(statement))
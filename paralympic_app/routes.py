@@ -1,13 +1,28 @@
+import csv
+import io
+import json
+import math
 from flask import (
     render_template,
     current_app as app,
     request,
     make_response,
     jsonify,
+    url_for,
+    stream_with_context,
 )
 from paralympic_app import db
-from paralympic_app.models import Region, Event
+from paralympic_app.cache import (
+    LRUCache,
+    bump_version,
+    cached_view,
+    conditional,
+    get_version,
+)
+from paralympic_app.models import Region, Event, event_fts, grid_cell_ranges
 from paralympic_app.schemas import RegionSchema, EventSchema
+from paralympic_app.serializers import RowSerializer
+from marshmallow import ValidationError
 
 
 # -------
@@ -18,6 +33,25 @@ regions_schema = RegionSchema(many=True)
 region_schema = RegionSchema()
 events_schema = EventSchema(many=True)
 event_schema = EventSchema()
+# Load to dicts rather than model instances, used for bulk inserts
+regions_load_schema = RegionSchema(many=True, load_instance=False)
+events_load_schema = EventSchema(many=True, load_instance=False)
+# Fast serializers for the read routes, the output is the same as the schemas above
+region_serializer = RowSerializer(region_schema)
+event_serializer = RowSerializer(event_schema)
+
+# -----
+# Cache
+# -----
+
+# Serialised results of get_events() and get_event(), see invalidate_events(). The keys
+# include the versions of the tables read before the query, so a result that a reader
+# stores after a write has committed is never returned for the new versions.
+event_cache = LRUCache(
+    maxsize=app.config["EVENT_CACHE_SIZE"], ttl=app.config["EVENT_CACHE_TTL"]
+)
+# Rendered HTML of the pages, see cached_view()
+page_cache = LRUCache(maxsize=app.config["PAGE_CACHE_SIZE"])
 
 # ------
 # Routes
@@ -25,6 +59,7 @@ event_schema = EventSchema()
 
 
 @app.route("/")
+@cached_view(page_cache, "event")
 def index():
     """Returns the home page"""
     # The following version using a url isn't supported by the flask test client, use selenium to test it
@@ -32,11 +67,13 @@ def index():
     # response = requests.get(url).json()
 
     # This version doesn't require a call to another URL so should work with the test client
-    response = get_events()
+    # Only the fields used in the template are read from the database
+    response = get_events(fields=("event_id", "location", "year", "type"))
     return render_template("index.html", event_list=response)
 
 
 @app.route("/display_event/<event_id>")
+@cached_view(page_cache, "event")
 def display_event(event_id):
     """Returns the event detail page"""
     ev = get_event(event_id)
@@ -44,41 +81,79 @@ def display_event(event_id):
 
 
 @app.get("/noc")
+@conditional("region")
 def noc():
     """Returns a response that conatins a list of NOC region codes and their details in JSON.
 
+    If the `limit` or `after` query parameters are given the regions are returned a page
+    at a time, see get_page(). If the request asks for NDJSON the regions are streamed one
+    per line, see stream_rows(). The `fields` query parameter limits the fields returned,
+    see get_serializer().
+
     A success response status code is 200 OK.
     """
+    try:
+        serializer = get_serializer(region_serializer)
+    except ValueError as e:
+        return error_response(400, "Bad request", str(e))
 
-    # Query using the syntax in the Flask-SQLAlchemy 3.x documentation
-    # https://flask-sqlalchemy.palletsprojects.com/en/3.0.x/queries/#select
-    all_regions = db.session.execute(db.select(Region)).scalars()
-    # Get the data using Marshmallow schema
-    result = regions_schema.dump(all_regions)
+    if is_stream_request():
+        return stream_rows(serializer.select(), serializer)
+    if is_paged_request():
+        return get_page(serializer.select(), Region.NOC, serializer)
+
+    # Get the data using the fast serializer, the same output as regions_schema.dump()
+    result = serializer.dump()
     response = make_response(result, 200)
     response.headers["Content-Type"] = "application/json"
     return response
 
 
 @app.get("/noc/<code>")
+@conditional("region", "event")
 def noc_code(code):
-    """Returns the details for a given region code."""
-    region = db.session.execute(
-        db.select(Region).filter_by(NOC=code)
-    ).scalar_one_or_none()
-    if region:
+    """Returns the details for a given region code.
+
+    With ?embed=events the events hosted by the region are included in an "events" list,
+    see get_region_with_events().
+    """
+    if request.args.get("embed") == "events":
+        region = get_region_with_events(code)
+        if region is None:
+            return error_response(404, "Not found", "Invalid resource URI")
         result = region_schema.dump(region)
+        result["events"] = events_schema.dump(region.events)
+        response = make_response(result, 200)
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    query = region_serializer.select().where(Region.NOC == code)
+    region = db.session.execute(query).one_or_none()
+    if region:
+        result = region_serializer.dump_row(region)
         response = make_response(result, 200)
         response.headers["Content-Type"] = "application/json"
     else:
-        message = jsonify(
-            {
-                "status": 404,
-                "error": "Not found",
-                "message": "Invalid resource URI",
-            }
-        )
-        response = make_response(message, 404)
+        response = error_response(404, "Not found", "Invalid resource URI")
+    return response
+
+
+@app.get("/noc/<code>/events")
+@conditional("region", "event")
+def noc_events(code):
+    """Returns the region and the events it has hosted as one JSON document.
+
+    The response has the region in "region" and a list of its events in "events".
+    """
+    region = get_region_with_events(code)
+    if region is None:
+        return error_response(404, "Not found", "Invalid resource URI")
+    result = {
+        "region": region_schema.dump(region),
+        "events": events_schema.dump(region.events),
+    }
+    response = make_response(result, 200)
+    response.headers["Content-Type"] = "application/json"
     return response
 
 
@@ -91,34 +166,64 @@ def noc_add():
     region = Region(NOC=NOC, region=region, notes=notes)
     db.session.add(region)
     db.session.commit()
+    invalidate_regions()
     result = region_schema.jsonify(region)
     response = make_response(result, 201)
     response.headers["Content-type"] = "application/json"
     return response
 
 
+@app.post("/noc/bulk")
+def noc_add_bulk():
+    """Adds many new NOC records to the dataset in a single transaction.
+
+    See bulk_insert() for the request and response formats.
+    """
+    response = bulk_insert(Region, Region.NOC, regions_load_schema)
+    invalidate_regions()
+    return response
+
+
+@app.patch("/noc")
+def noc_update_bulk():
+    """Updates changed fields for many NOC records in a single transaction.
+
+    See bulk_update() for the request and response formats.
+    """
+    # The schema doesn't use Region.events so raise an error rather than lazy loading
+    # them if that changes.
+    response = bulk_update(
+        Region.NOC, region_schema, db.raiseload(Region.events)
+    )
+    invalidate_regions()
+    return response
+
+
 @app.patch("/noc/<code>")
 def noc_update(code):
-    """Updates changed fields for the NOC record
-
-    TODO: Handle 404 error"""
+    """Updates changed fields for the NOC record"""
     # https://flask-sqlalchemy.palletsprojects.com/en/3.0.x/queries/#insert-update-delete
     # Find the current region in the database
     existing_region = db.session.execute(
-        db.select(Region).filter_by(NOC=code)
+        db.select(Region)
+        .filter_by(NOC=code)
+        .options(db.raiseload(Region.events))
     ).scalar_one_or_none()
+    if existing_region is None:
+        return error_response(404, "Not found", "Invalid resource URI")
     # Get the updated details from the json sent in the HTTP patch request
     region_json = request.get_json()
-    # Use Marshmallow to update the existing records with the changes in the json
-    region_schema.load(region_json, instance=existing_region, partial=True)
+    # Use Marshmallow to update the existing records with the changes in the json and
+    # write them to the database
+    try:
+        result = update_instance(existing_region, region_schema, region_json)
+    except ValidationError as err:
+        return error_response(400, "Bad request", err.messages)
     # Commit the changes to the database
     db.session.commit()
+    invalidate_regions()
     # Return json showing the updated record
-    updated_region = db.session.execute(
-        db.select(Region).filter_by(NOC=code)
-    ).scalar_one_or_none()
-    result = region_schema.jsonify(updated_region)
-    response = make_response(result, 200)
+    response = make_response(jsonify(result), 200)
     response.headers["Content-Type"] = "application/json"
     return response
 
@@ -133,6 +238,7 @@ def noc_delete(code):
     ).scalar_one_or_none()
     db.session.delete(region)
     db.session.commit()
+    invalidate_regions()
     # This example returns a custom HTTP response using flask make_response
     # https://flask.palletsprojects.com/en/2.2.x/api/?highlight=make_response#flask.make_response
     text = jsonify({"Successfully deleted": region.NOC})
@@ -141,19 +247,175 @@ def noc_delete(code):
     return response
 
 
+@app.get("/cache/stats")
+def cache_stats():
+    """Returns the size and hit, miss and eviction counts of the caches in JSON"""
+    result = {"event": event_cache.stats(), "page": page_cache.stats()}
+    response = make_response(result, 200)
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
 @app.get("/event")
+@conditional("event", "region")
 def event():
-    """Returns the details for all events"""
-    result = get_events()
+    """Returns the details for all events
+
+    If the `limit` or `after` query parameters are given the events are returned a page
+    at a time, see get_page(). If the request asks for NDJSON the events are streamed one
+    per line, see stream_rows(), and if it asks for CSV they are streamed as CSV, see
+    stream_csv(). The `fields` query parameter limits the fields returned, see
+    get_serializer(). The events can be filtered and sorted, see get_event_filters().
+    """
+    try:
+        serializer = get_serializer(event_serializer)
+        filters = get_event_filters()
+    except ValueError as e:
+        return error_response(400, "Bad request", str(e))
+
+    if is_csv_request():
+        return stream_csv(
+            filter_events(serializer.select(), filters),
+            serializer,
+            "events.csv",
+        )
+    if is_stream_request():
+        return stream_rows(
+            filter_events(serializer.select(), filters), serializer
+        )
+    if is_paged_request():
+        if dict(filters).get("sort"):
+            message = "sort can't be used with limit or after"
+            return error_response(400, "Bad request", message)
+        query = filter_events(serializer.select(), filters)
+        return get_page(query, Event.event_id, serializer)
+
+    result = get_events(serializer, filters=filters)
     response = make_response(result, 200)
     response.headers["Content-Type"] = "application/json"
     return response
 
 
+@app.get("/event.csv")
+@conditional("event", "region")
+def event_csv():
+    """Returns the events as a CSV file, see stream_csv().
+
+    Takes the same `fields`, filter and `sort` query parameters as /event.
+    """
+    try:
+        serializer = get_serializer(event_serializer)
+        filters = get_event_filters()
+    except ValueError as e:
+        return error_response(400, "Bad request", str(e))
+    return stream_csv(
+        filter_events(serializer.select(), filters), serializer, "events.csv"
+    )
+
+
+@app.get("/event/stats")
+@conditional("event", "region")
+def event_stats():
+    """Returns totals for the events, optionally grouped by year, type and/or NOC.
+
+    `group_by` is a comma separated list of the columns to group by, e.g.
+    /event/stats?group_by=year,type. The filters of the /event route can also be used,
+    e.g. ?year_min=2000. The aggregates are calculated by the database.
+    """
+    group_by = request.args.get("group_by", "")
+    group_by = tuple(g.strip() for g in group_by.split(",") if g.strip())
+    for name in group_by:
+        if name not in ("year", "type", "NOC"):
+            message = f"Can't group by {name}, use year, type or NOC"
+            return error_response(400, "Bad request", message)
+    try:
+        filters = get_event_filters()
+    except ValueError as e:
+        return error_response(400, "Bad request", str(e))
+    # The groups are always sorted by the group_by columns
+    filters = tuple(f for f in filters if f[0] != "sort")
+
+    key = ("stats", group_by, filters, get_version("event", "region"))
+    result = event_cache.get_or_set(
+        key, lambda: get_event_stats(group_by, filters)
+    )
+    response = make_response(jsonify(result), 200)
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+@app.get("/event/near")
+@conditional("event", "region")
+def event_near():
+    """Returns the events within a distance of a point, nearest first.
+
+    The query parameters `lat` and `lon` are the point in degrees and `radius_km` is the
+    distance in kilometres. Each event has an extra "distance_km" field. The `fields`
+    query parameter limits the other fields returned, see get_serializer().
+    """
+    try:
+        lat = float(request.args["lat"])
+        lon = float(request.args["lon"])
+        radius_km = float(request.args["radius_km"])
+        serializer = get_serializer(event_serializer)
+    except KeyError:
+        message = "lat, lon and radius_km are required"
+        return error_response(400, "Bad request", message)
+    except ValueError as e:
+        return error_response(400, "Bad request", str(e))
+    max_radius = app.config["NEAR_MAX_RADIUS_KM"]
+    if not (
+        -90 <= lat <= 90 and -180 <= lon <= 180 and 0 < radius_km <= max_radius
+    ):
+        message = f"lat, lon or radius_km out of range, radius_km must be at most {max_radius}"
+        return error_response(400, "Bad request", message)
+
+    result = get_events_near(lat, lon, radius_km, serializer)
+    response = make_response(jsonify(result), 200)
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+@app.get("/event/search")
+@conditional("event", "region")
+def event_search():
+    """Returns the events that match a full text search, best match first.
+
+    `q` is the words to search for in the location, disabilities included and highlights
+    of the events. All the words must match; a word ending in * matches any word starting
+    with it. `limit` is the maximum number of events, 1 to MAX_PAGE_SIZE, default
+    PAGE_SIZE; any other limit is a 400 error. Each event has an extra "rank" field
+    (lower is better) and a "snippet" of the matching text with the matches in <b></b>.
+    The `fields` query parameter limits the other fields returned.
+    """
+    q = request.args.get("q", "").strip()
+    if not q:
+        return error_response(400, "Bad request", "q is required")
+    try:
+        limit = get_limit()
+        serializer = get_serializer(event_serializer)
+    except ValueError as e:
+        return error_response(400, "Bad request", str(e))
+
+    result = search_events(q, limit, serializer)
+    response = make_response(jsonify(result), 200)
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
 @app.get("/event/<int:event_id>")
+@conditional("event", "region")
 def event_id(event_id):
-    """Returns the details for a specified event"""
-    result = get_event(event_id)
+    """Returns the details for a specified event
+
+    The `fields` query parameter limits the fields returned, see get_serializer().
+    """
+    try:
+        serializer = get_serializer(event_serializer)
+    except ValueError as e:
+        return error_response(400, "Bad request", str(e))
+
+    result = get_event(event_id, serializer)
     response = make_response(result, 200)
     response.headers["Content-Type"] = "application/json"
     return response
@@ -199,53 +461,796 @@ def event_add():
     )
     db.session.add(event)
     db.session.commit()
+    bump_version("event")
+    invalidate_events(event.event_id)
     result = event_schema.jsonify(event)
     response = make_response(result, 201)
     response.headers["Content-Type"] = "application/json"
     return response
 
 
+@app.post("/event/bulk")
+def event_add_bulk():
+    """Adds many new event records to the dataset in a single transaction.
+
+    See bulk_insert() for the request and response formats.
+    """
+    response = bulk_insert(Event, Event.event_id, events_load_schema)
+    bump_version("event")
+    # The ids of new events are not known in advance, so clear every cached event
+    event_cache.clear()
+    page_cache.clear()
+    return response
+
+
+@app.patch("/event")
+def event_update_bulk():
+    """Updates changed fields for many events in a single transaction.
+
+    See bulk_update() for the request and response formats.
+    """
+    # The schema includes the region so it is loaded in the same query
+    response = bulk_update(
+        Event.event_id, event_schema, db.joinedload(Event.region)
+    )
+    bump_version("event")
+    event_cache.clear()
+    page_cache.clear()
+    return response
+
+
 @app.patch("/event/<event_id>")
 def event_update(event_id):
-    """Updates changed fields for the event
-    TODO: does not handle a partial update despite partial=True
-    """
-    # Find the current event in the database
+    """Updates changed fields for the event"""
+    # Find the current event in the database. The schema includes the region so it is
+    # loaded in the same query rather than by a second lazy load query.
     existing_event = db.session.execute(
-        db.select(Event).filter_by(event_id=event_id)
+        db.select(Event)
+        .filter_by(event_id=event_id)
+        .options(db.joinedload(Event.region))
     ).scalar_one_or_none()
+    if existing_event is None:
+        return error_response(404, "Not found", "Invalid resource URI")
     # Get the updated details from the json sent in the HTTP patch request
     event_json = request.get_json()
-    # Use Marshmallow to update the existing records with the changes in the json
-    event_schema.load(event_json, instance=existing_event, partial=True)
+    # Use Marshmallow to update the existing records with the changes in the json and
+    # write them to the database
+    try:
+        result = update_instance(existing_event, event_schema, event_json)
+    except ValidationError as err:
+        return error_response(400, "Bad request", err.messages)
+    # The id from the database, as the one in the URL may be e.g. "1.0" for event 1. Read
+    # before the commit, which expires the instance.
+    event_id = existing_event.event_id
     # Commit the changes to the database
     db.session.commit()
+    bump_version("event")
+    invalidate_events(event_id)
     # Return json showing the updated record
-    updated_event = db.session.execute(
-        db.select(Event).filter_by(event_id=event_id)
-    ).scalar_one_or_none()
-    result = event_schema.jsonify(updated_event)
-    response = make_response(result, 200)
+    response = make_response(jsonify(result), 200)
     response.headers["Content-Type"] = "application/json"
     return response
 
 
-def get_events():
+def get_events(serializer=None, fields=None, filters=()):
     """Function to get all events from the database as objects and convert to json.
 
+    The result is cached in event_cache, so it must not be modified by the caller.
+
     NB: This was extracted to a separate function as it is used in multiple places
+
+    Args:
+        serializer: the RowSerializer to use, defaults to all the fields of an event
+        fields: a list of field names, used instead of serializer to get only those fields
+        filters: the filters and sort order from get_event_filters()
     """
-    all_events = db.session.execute(db.select(Event)).scalars()
-    event_json = events_schema.dump(all_events)
-    return event_json
+    if fields is not None:
+        serializer = event_serializer.only(fields)
+    serializer = serializer or event_serializer
 
+    def query():
+        return serializer.dump(filter_events(serializer.select(), filters))
 
-def get_event(event_id):
+    key = (
+        "events",
+        tuple(serializer.names),
+        filters,
+        get_version("event", "region"),
+    )
+    return event_cache.get_or_set(key, query)
+
+
+def get_event(event_id, serializer=None):
     """Function to get a single event as a json structure
 
-    TODO: handle 404 error"""
-    event = db.session.execute(
-        db.select(Event).filter_by(event_id=event_id)
-    ).scalar_one_or_none()
-    result = event_schema.dump(event)
-    return result
+    The result is cached in event_cache, so it must not be modified by the caller.
+
+    TODO: handle 404 error
+
+    Args:
+        event_id: the id of the event
+        serializer: the RowSerializer to use, defaults to all the fields of an event
+    """
+    serializer = serializer or event_serializer
+    # The id from the URL of /display_event is a string, so that e.g. "02" and "2" are
+    # cached once and invalidate_events() finds them
+    try:
+        event_id = int(event_id)
+    except ValueError:
+        # Same as an event that doesn't exist
+        return {}
+
+    def query():
+        query = serializer.select().where(Event.event_id == event_id)
+        event = db.session.execute(query).one_or_none()
+        # Same as event_schema.dump(None) when the event doesn't exist
+        return serializer.dump_row(event) if event else {}
+
+    key = (
+        "event",
+        event_id,
+        tuple(serializer.names),
+        get_version("event", "region"),
+    )
+    return event_cache.get_or_set(key, query)
+
+
+def get_event_stats(group_by, filters):
+    """Returns the number of games and the totals of participants, male, female and countries.
+
+    Args:
+        group_by: tuple of the names of the event columns to group by
+        filters: the filters from get_event_filters()
+    """
+    columns = [Event.__table__.c[name] for name in group_by]
+    query = (
+        db.select(
+            *columns,
+            db.func.count().label("games"),
+            db.func.sum(Event.participants).label("participants"),
+            db.func.sum(Event.male).label("male"),
+            db.func.sum(Event.female).label("female"),
+            db.func.sum(Event.countries).label("countries"),
+        )
+        .group_by(*columns)
+        .order_by(*columns)
+    )
+    query = filter_events(query, filters)
+    return [row._asdict() for row in db.session.execute(query)]
+
+
+def invalidate_events(event_id):
+    """Removes the lists of events, the stats and the given event from the cache after it is written.
+
+    Each of these can be cached several times with different fields and filters. The
+    keys of the old versions of the tables are no longer used after bump_version(), so
+    this frees their memory rather than the LRU order.
+
+    Args:
+        event_id: the int id of the event, as in the keys of get_event()
+    """
+    event_cache.invalidate_matching(
+        lambda key: key[0] in ("events", "stats")
+        or key[:2] == ("event", event_id)
+    )
+    # The cached pages are for the previous version of the event table
+    page_cache.clear()
+
+
+def invalidate_regions():
+    """Records a write to the region table and removes the cached events and pages.
+
+    Every event includes its region, so all the cached events are removed.
+    """
+    bump_version("region")
+    event_cache.clear()
+    page_cache.clear()
+
+
+def search_events(q, limit, serializer):
+    """Returns the events that match the words in q, ranked with the FTS5 bm25 function
+
+    Args:
+        q: the words to search for
+        limit: the maximum number of events to return
+        serializer: the RowSerializer for the fields to return
+    """
+    # Each word is quoted so that characters that are part of the FTS5 query syntax are
+    # searched for rather than causing a syntax error, e.g. "wheelchair" "rugby"
+    terms = []
+    for word in q.split():
+        prefix = word.endswith("*") and len(word) > 1
+        word = word.rstrip("*").replace('"', '""')
+        terms.append(f'"{word}"' + ("*" if prefix else ""))
+
+    rank = db.func.bm25(event_fts.c.event_fts)
+    snippet = db.func.snippet(
+        event_fts.c.event_fts, -1, "<b>", "</b>", "...", 12
+    )
+    query = (
+        serializer.select()
+        .join(event_fts, event_fts.c.rowid == Event.event_id)
+        .add_columns(rank, snippet)
+        .where(event_fts.c.event_fts.op("MATCH")(" ".join(terms)))
+        .order_by(rank)
+        .limit(limit)
+    )
+    results = []
+    for row in db.session.execute(query):
+        event = serializer.dump_row(row)
+        event["rank"] = row[-2]
+        event["snippet"] = row[-1]
+        results.append(event)
+    return results
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def get_events_near(lat, lon, radius_km, serializer):
+    """Returns the events within radius_km of (lat, lon), nearest first.
+
+    The database only searches the cells of the location grid (see Event.grid_cell) that
+    overlap the bounding box of the circle, using the index on the grid cell, and then
+    only keeps the events in the bounding box. The exact distance is then calculated for
+    these events with the haversine formula.
+
+    Args:
+        lat: latitude of the point in degrees
+        lon: longitude of the point in degrees
+        radius_km: the distance from the point in kilometres
+        serializer: the RowSerializer for the fields to return
+    """
+    # Bounding box of the circle, widening in longitude away from the equator
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    lat_min, lat_max = max(lat - lat_delta, -90), min(lat + lat_delta, 90)
+    if lat_min == -90 or lat_max == 90:
+        # The circle contains a pole so includes every longitude
+        lon_boxes = [(-180, 180)]
+    else:
+        cos_lat = min(
+            math.cos(math.radians(lat_min)), math.cos(math.radians(lat_max))
+        )
+        lon_delta = lat_delta / cos_lat
+        if lon_delta >= 180:
+            lon_boxes = [(-180, 180)]
+        elif lon - lon_delta < -180:
+            # The box crosses the antimeridian so is split in two
+            lon_boxes = [(lon - lon_delta + 360, 180), (-180, lon + lon_delta)]
+        elif lon + lon_delta > 180:
+            lon_boxes = [(lon - lon_delta, 180), (-180, lon + lon_delta - 360)]
+        else:
+            lon_boxes = [(lon - lon_delta, lon + lon_delta)]
+
+    conditions = []
+    for lon_min, lon_max in lon_boxes:
+        cells = db.or_(
+            *(
+                Event.grid_cell.between(first, last)
+                for first, last in grid_cell_ranges(
+                    lat_min, lat_max, lon_min, lon_max
+                )
+            )
+        )
+        conditions.append(
+            db.and_(
+                cells,
+                Event.lat.between(lat_min, lat_max),
+                Event.lon.between(lon_min, lon_max),
+            )
+        )
+    # lat and lon are added after the fields so the distance can be calculated even if
+    # they are not one of the fields, the serializer ignores the extra columns
+    query = serializer.select().add_columns(Event.lat, Event.lon)
+    query = query.where(db.or_(*conditions))
+
+    results = []
+    for row in db.session.execute(query):
+        distance = haversine_km(lat, lon, row[-2], row[-1])
+        if distance <= radius_km:
+            event = serializer.dump_row(row)
+            event["distance_km"] = round(distance, 3)
+            results.append(event)
+    results.sort(key=lambda e: e["distance_km"])
+    return results
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Returns the great circle distance in kilometres between two points in degrees"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def get_region_with_events(code):
+    """Returns the region with its events, or None if there is no region with the code.
+
+    The events are loaded with the region in a single query that joins the two tables
+    using the Region.events relationship. Each event's region is then found in the
+    session, so dumping the events doesn't run any more queries.
+    """
+    query = (
+        db.select(Region)
+        .where(Region.NOC == code)
+        .options(db.joinedload(Region.events))
+    )
+    return db.session.execute(query).unique().scalar_one_or_none()
+
+
+def get_event_filters():
+    """Returns the event filters and sort order from the query parameters.
+
+    The filters are `year`, `year_min` and `year_max` (inclusive), `type` and `NOC`, all
+    of which use an index on the event table. `sort` is a comma separated list of event
+    columns, each optionally prefixed with - for descending order, e.g. sort=-year,NOC.
+
+    Returns:
+        A tuple of (name, value) pairs, in a fixed order so it can be used as a cache key
+
+    Raises:
+        ValueError: if a value is not valid
+    """
+    filters = []
+    for name in ("year", "year_min", "year_max"):
+        value = request.args.get(name)
+        if value is not None:
+            try:
+                filters.append((name, int(value)))
+            except ValueError:
+                raise ValueError(f"{name} must be an integer")
+    for name in ("type", "NOC"):
+        value = request.args.get(name)
+        if value is not None:
+            filters.append((name, value))
+    sort = request.args.get("sort")
+    if sort:
+        sort = tuple(s.strip() for s in sort.split(",") if s.strip())
+        for column in sort:
+            if column.lstrip("-") not in Event.__table__.columns:
+                raise ValueError(f"Can't sort by {column}")
+        filters.append(("sort", sort))
+    return tuple(filters)
+
+
+def filter_events(query, filters):
+    """Adds the WHERE and ORDER BY clauses for the filters to an event query
+
+    Args:
+        query: a select statement for the event table
+        filters: the filters and sort order from get_event_filters()
+    """
+    for name, value in filters:
+        if name == "year":
+            query = query.where(Event.year == value)
+        elif name == "year_min":
+            query = query.where(Event.year >= value)
+        elif name == "year_max":
+            query = query.where(Event.year <= value)
+        elif name == "type":
+            query = query.where(Event.type == value)
+        elif name == "NOC":
+            query = query.where(Event.NOC == value)
+        elif name == "sort":
+            for column in value:
+                if column.startswith("-"):
+                    query = query.order_by(
+                        Event.__table__.c[column[1:]].desc()
+                    )
+                else:
+                    query = query.order_by(Event.__table__.c[column])
+            # Events with the same values are in a consistent order
+            query = query.order_by(Event.event_id)
+    return query
+
+
+def get_serializer(serializer):
+    """Returns the serializer for the fields in the `fields` query parameter.
+
+    `fields` is a comma separated list of field names, e.g. ?fields=event_id,year. Only
+    those fields are selected from the database and returned.
+
+    Args:
+        serializer: the RowSerializer for all the fields, returned if `fields` isn't given
+
+    Raises:
+        ValueError: if any of the fields are not valid
+    """
+    fields = request.args.get("fields")
+    if not fields:
+        return serializer
+    return serializer.only(f.strip() for f in fields.split(",") if f.strip())
+
+
+def get_limit():
+    """Returns the `limit` query parameter, default PAGE_SIZE.
+
+    Raises:
+        ValueError: if limit isn't an integer between 1 and MAX_PAGE_SIZE
+    """
+    try:
+        limit = int(request.args.get("limit", app.config["PAGE_SIZE"]))
+    except ValueError:
+        raise ValueError("limit must be an integer") from None
+    if not 1 <= limit <= app.config["MAX_PAGE_SIZE"]:
+        raise ValueError(
+            f"limit must be between 1 and {app.config['MAX_PAGE_SIZE']}"
+        )
+    return limit
+
+
+def error_response(status, error, message):
+    """Returns a JSON error response in the format used by all the API routes"""
+    text = jsonify({"status": status, "error": error, "message": message})
+    return make_response(text, status)
+
+
+def is_paged_request():
+    """Returns True if the request asks for a page of results rather than all of them"""
+    return "limit" in request.args or "after" in request.args
+
+
+def is_stream_request():
+    """Returns True if the request asks for results streamed as NDJSON.
+
+    This is either with the `stream=1` query parameter or an Accept header that prefers
+    application/x-ndjson to application/json.
+    """
+    if request.args.get("stream") in ("1", "true"):
+        return True
+    accept = request.accept_mimetypes
+    return accept.quality("application/x-ndjson") > accept.quality(
+        "application/json"
+    )
+
+
+def is_csv_request():
+    """Returns True if the Accept header prefers text/csv to application/json"""
+    accept = request.accept_mimetypes
+    return accept.quality("text/csv") > accept.quality("application/json")
+
+
+def stream_csv(query, serializer, filename):
+    """Returns a streamed CSV response with a header row of the field names.
+
+    As in stream_rows() the rows are fetched in batches of STREAM_BATCH_SIZE, and each
+    batch is written as CSV and sent before the next is fetched, so the whole file is
+    never held in memory. The columns are in the order of the table's columns, followed
+    by any related fields, and null values are empty.
+
+    Args:
+        query: the select statement for the rows, from serializer.select()
+        serializer: the RowSerializer whose field names are the columns
+        filename: the file name suggested to the client in Content-Disposition
+    """
+    batch_size = app.config["STREAM_BATCH_SIZE"]
+    # The order of the fields of a schema isn't fixed, so select the columns in the
+    # order of the table
+    order = serializer.model.__table__.columns.keys()
+    columns = sorted(
+        serializer.columns,
+        key=lambda c: order.index(c.name) if c.name in order else len(order),
+    )
+    query = query.with_only_columns(*columns)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([column.name for column in columns])
+        rows = db.session.execute(
+            query.execution_options(yield_per=batch_size)
+        )
+        for batch in rows.partitions():
+            writer.writerows(batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        # The header of an empty result
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    response = app.response_class(
+        stream_with_context(generate()), mimetype="text/csv"
+    )
+    response.headers[
+        "Content-Disposition"
+    ] = f"attachment; filename={filename}"
+    return response
+
+
+def stream_rows(query, serializer):
+    """Returns a streamed response with one JSON record per line (NDJSON).
+
+    Rows are fetched from the database in batches of STREAM_BATCH_SIZE (yield_per) and
+    each one is serialised and sent as it is read, so the full result is never held in
+    memory and the first record is sent without waiting for the rest of the query.
+
+    Args:
+        query: the select statement for the rows, from serializer.select()
+        serializer: the RowSerializer used to serialise the rows
+    """
+    batch_size = app.config["STREAM_BATCH_SIZE"]
+    dumps = app.json.dumps
+
+    def generate():
+        rows = db.session.execute(
+            query.execution_options(yield_per=batch_size)
+        )
+        for row in rows:
+            yield dumps(serializer.dump_row(row)) + "\n"
+
+    return app.response_class(
+        stream_with_context(generate()), mimetype="application/x-ndjson"
+    )
+
+
+def get_page(query, key_column, serializer):
+    """Returns one page of results using keyset (cursor) pagination.
+
+    Rows are ordered by key_column, which must be unique, and only the rows with a key
+    greater than the `after` query parameter are selected. This means each page is an
+    index range scan on the key rather than an OFFSET scan over all the earlier rows.
+
+    The response is a JSON object with the page of results in "data" and the URL of the
+    following page in "next" (null on the last page).
+
+    Args:
+        query: the select statement for the rows, from serializer.select()
+        key_column: the unique column to page on, e.g. Event.event_id
+        serializer: the RowSerializer used to serialise the rows
+    """
+    try:
+        limit = get_limit()
+    except ValueError as e:
+        return error_response(400, "Bad request", str(e))
+
+    after = request.args.get("after")
+    if after is not None:
+        try:
+            after = key_column.type.python_type(after)
+        except ValueError:
+            return error_response(400, "Bad request", "Invalid after value")
+        query = query.where(key_column > after)
+
+    # Fetch one extra row to find out if there is a following page. The key is added as
+    # the last column so that it is available even if it isn't one of the fields, the
+    # serializer ignores any extra columns.
+    query = query.add_columns(key_column).order_by(key_column).limit(limit + 1)
+    rows = db.session.execute(query).all()
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        args = request.args.to_dict()
+        args.update(limit=limit, after=rows[-1][-1])
+        next_url = url_for(request.endpoint, **args)
+
+    result = {"data": serializer.dump_rows(rows), "next": next_url}
+    response = make_response(result, 200)
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+def get_bulk_rows():
+    """Returns the list of records in the body of a bulk request.
+
+    The body is either a JSON array or, if the Content-Type is application/x-ndjson,
+    one JSON object per line.
+
+    Raises:
+        ValueError: if the body is not in one of these formats
+    """
+    if request.mimetype == "application/x-ndjson":
+        rows = []
+        lines = request.get_data(as_text=True).splitlines()
+        for line_number, line in enumerate(lines, start=1):
+            if line.strip():
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    raise ValueError(f"Line {line_number} is not valid JSON")
+    else:
+        rows = request.get_json(silent=True)
+        if not isinstance(rows, list):
+            raise ValueError("The request body must be a JSON array")
+    return rows
+
+
+def bulk_insert(model, key_column, schema):
+    """Validates and inserts the records in a bulk request.
+
+    All the records are validated with the schema in one call, then the valid records
+    whose key is not already in use are inserted with a single executemany INSERT in one
+    transaction, so there is one commit for the whole batch rather than one per record.
+
+    The response lists the status of each record in the order they were sent:
+    201 created, 400 failed validation (with the errors) or 409 key already exists.
+    The response status is 201 if every record was created, otherwise 207.
+
+    NB: The key of a new record is only reported if it was included in the request, as
+    an executemany INSERT does not return the generated keys.
+
+    Args:
+        model: the model class of the table, e.g. Event
+        key_column: the primary key column, e.g. Event.event_id
+        schema: Marshmallow schema with many=True and load_instance=False
+    """
+    try:
+        rows = get_bulk_rows()
+    except ValueError as e:
+        return error_response(400, "Bad request", str(e))
+    if len(rows) > app.config["BULK_MAX_ROWS"]:
+        message = (
+            f"A maximum of {app.config['BULK_MAX_ROWS']} records can be sent"
+        )
+        return error_response(400, "Bad request", message)
+
+    try:
+        loaded = schema.load(rows)
+        errors = {}
+    except ValidationError as err:
+        loaded = err.valid_data
+        errors = err.messages
+
+    # Find keys that are already in the database or repeated in the request
+    key = key_column.key
+    keys = [
+        row[key]
+        for index, row in enumerate(loaded)
+        if index not in errors and row.get(key) is not None
+    ]
+    existing = set()
+    for i in range(0, len(keys), 500):
+        query = db.select(key_column).where(key_column.in_(keys[i : i + 500]))
+        existing.update(db.session.execute(query).scalars())
+
+    columns = model.__table__.columns.keys()
+    results = []
+    new_rows = []
+    for index, row in enumerate(loaded):
+        if index in errors:
+            results.append(
+                {"index": index, "status": 400, "errors": errors[index]}
+            )
+        elif row.get(key) is not None and row[key] in existing:
+            results.append(
+                {"index": index, "status": 409, "error": "Already exists"}
+            )
+        else:
+            if row.get(key) is not None:
+                existing.add(row[key])
+            new_rows.append({c: row.get(c) for c in columns})
+            results.append({"index": index, "status": 201, key: row.get(key)})
+
+    if new_rows:
+        # A list of parameters makes this an executemany INSERT
+        db.session.execute(db.insert(model), new_rows)
+        db.session.commit()
+
+    status = 201 if len(new_rows) == len(results) else 207
+    result = {"created": len(new_rows), "results": results}
+    response = make_response(result, status)
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+def update_instance(instance, schema, changes):
+    """Applies a partial update to an instance and returns the updated record as a dict.
+
+    The changes are flushed to the database and the record is dumped before the caller
+    commits, as committing expires the instance and dumping it afterwards would need
+    another SELECT to reload it.
+
+    Args:
+        instance: the model instance to update, loaded in the current session
+        schema: the Marshmallow schema for the model, with load_instance=True
+        changes: dict of the fields to change
+
+    Raises:
+        ValidationError: if the changes are not valid, the instance is not changed
+    """
+    schema.load(changes, instance=instance, partial=True)
+    db.session.flush()
+    # Changing a foreign key doesn't change the related object that was loaded with the
+    # instance, so reload any that are out of date
+    mapper = db.inspect(instance).mapper
+    for relationship in mapper.relationships:
+        if (
+            relationship.direction.name == "MANYTOONE"
+            and relationship.key not in changes
+            and any(
+                column.key in changes for column in relationship.local_columns
+            )
+        ):
+            db.session.expire(instance, [relationship.key])
+    return schema.dump(instance)
+
+
+def bulk_update(key_column, schema, *options):
+    """Validates and applies the partial updates in a bulk request.
+
+    The body is a list of records in the formats accepted by get_bulk_rows(). Each
+    record has the primary key of the record to update and the fields to change. The
+    records to update are found with one SELECT for every 500 keys and all the changes
+    are committed in one transaction.
+
+    The response lists the status of each record in the order they were sent:
+    200 updated (with the updated record), 400 failed validation or has a missing or
+    invalid key (with the errors) or 404 not found. The response status is 200 if every record was updated,
+    otherwise 207.
+
+    Args:
+        key_column: the primary key column, e.g. Event.event_id
+        schema: Marshmallow schema with load_instance=True
+        options: loader options for the SELECT, e.g. to load the relationships the
+            schema dumps
+    """
+    try:
+        rows = get_bulk_rows()
+    except ValueError as e:
+        return error_response(400, "Bad request", str(e))
+    if len(rows) > app.config["BULK_MAX_ROWS"]:
+        message = (
+            f"A maximum of {app.config['BULK_MAX_ROWS']} records can be sent"
+        )
+        return error_response(400, "Bad request", message)
+
+    key = key_column.key
+    # The key of each record converted by the schema, e.g. "1" or 1.0 to 1, or the
+    # errors if it isn't valid, by the index of the record
+    keys = {}
+    key_errors = {}
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict) or row.get(key) is None:
+            continue
+        try:
+            keys[index] = schema.fields[key].deserialize(row[key])
+        except ValidationError as err:
+            key_errors[index] = {key: err.messages}
+    unique_keys = list(dict.fromkeys(keys.values()))
+    model = key_column.class_
+    instances = {}
+    for i in range(0, len(unique_keys), 500):
+        query = (
+            db.select(model)
+            .where(key_column.in_(unique_keys[i : i + 500]))
+            .options(*options)
+        )
+        for instance in db.session.execute(query).scalars():
+            instances[getattr(instance, key)] = instance
+
+    results = []
+    updated = 0
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict) or row.get(key) is None:
+            error = {key: ["Missing data for required field."]}
+            results.append({"index": index, "status": 400, "errors": error})
+            continue
+        if index in key_errors:
+            results.append(
+                {"index": index, "status": 400, "errors": key_errors[index]}
+            )
+            continue
+        instance = instances.get(keys[index])
+        if instance is None:
+            results.append(
+                {"index": index, "status": 404, "error": "Not found"}
+            )
+            continue
+        try:
+            record = update_instance(instance, schema, row)
+        except ValidationError as err:
+            results.append(
+                {"index": index, "status": 400, "errors": err.messages}
+            )
+            continue
+        updated += 1
+        results.append({"index": index, "status": 200, "record": record})
+    db.session.commit()
+
+    status = 200 if updated == len(results) else 207
+    result = {"updated": updated, "results": results}
+    response = make_response(result, status)
+    response.headers["Content-Type"] = "application/json"
+    return response
@@ -0,0 +1,124 @@
+"""Fast read-only serializers that bypass Marshmallow.
+
+Dumping with the Marshmallow schemas loads every row as an ORM object and then converts
+each field in turn, which is most of the time spent on the GET routes. RowSerializer
+instead selects just the columns the schema dumps with a SQLAlchemy Core query and builds
+each dict directly from the row tuple. The fields and conversions are taken from the
+schema so the output is identical to schema.dump().
+
+Marshmallow is still used for everything that loads data (POST and PATCH requests).
+"""
+from functools import lru_cache
+from marshmallow import fields
+from marshmallow_sqlalchemy.fields import Related
+from paralympic_app import db
+
+
+# How Marshmallow converts a non-null value of each field type when dumping
+_CONVERTERS = {
+    fields.String: str,
+    fields.Integer: int,
+    fields.Float: float,
+    fields.Boolean: bool,
+}
+
+
+class RowSerializer:
+    """Serializes rows of the model of a Marshmallow-SQLAlchemy schema.
+
+    Supports schemas whose fields are columns of the model or Related fields for a
+    many-to-one relationship with a single column primary key.
+
+    Args:
+        schema: a SQLAlchemySchema or SQLAlchemyAutoSchema instance
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.model = schema.opts.model
+        self.names = []
+        self.columns = []
+        self.converters = []
+        self.joins = []
+        mapper = self.model.__mapper__
+        for name, field in schema.dump_fields.items():
+            if isinstance(field, Related):
+                relationship = mapper.relationships[field.attribute or name]
+                target = relationship.mapper
+                if relationship.uselist or len(target.primary_key) != 1:
+                    raise ValueError(f"Related field {name} is not supported")
+                # Marshmallow dumps the primary key of the related row, which is null
+                # when there is no related row, so use an outer join. The key value
+                # is dumped as it is, without conversion.
+                column = target.primary_key[0]
+                self.joins.append(relationship.class_attribute)
+                converter = None
+            else:
+                column = mapper.columns[field.attribute or name]
+                if type(field) not in _CONVERTERS:
+                    raise ValueError(f"Field {name} has an unsupported type")
+                converter = _CONVERTERS[type(field)]
+            self.names.append(name)
+            self.columns.append(column.label(name))
+            self.converters.append(converter)
+
+    def select(self):
+        """Returns a Core select statement for the columns the schema dumps.
+
+        Filters, ordering and limits can be added to the statement before it is passed to
+        dump_rows().
+        """
+        query = db.select(*self.columns).select_from(self.model)
+        for join in self.joins:
+            query = query.outerjoin(join)
+        return query
+
+    def dump_row(self, row):
+        """Returns the dict for a single row tuple"""
+        return {
+            name: (
+                value if convert is None or value is None else convert(value)
+            )
+            for name, convert, value in zip(self.names, self.converters, row)
+        }
+
+    def dump_rows(self, rows):
+        """Returns a list of dicts for an iterable of row tuples"""
+        return list(map(self.dump_row, rows))
+
+    def only(self, fields):
+        """Returns a serializer for just the given fields, see project().
+
+        Raises:
+            ValueError: if there are no fields or any of them are not in the schema
+        """
+        fields = tuple(sorted(set(fields)))
+        if not fields:
+            # A SELECT with no columns isn't valid
+            raise ValueError("fields must include at least one field")
+        return project(type(self.schema), fields)
+
+    def dump(self, query=None):
+        """Executes the query and returns the list of dicts for the rows.
+
+        Args:
+            query: a statement from select(), with any filters added. Defaults to all rows.
+        """
+        if query is None:
+            query = self.select()
+        return self.dump_rows(db.session.execute(query))
+
+
+@lru_cache(maxsize=64)
+def project(schema_class, fields):
+    """Returns a RowSerializer that selects and dumps only the given fields.
+
+    The projection is applied to both the schema (only=fields) and the SELECT, so columns
+    that are not wanted are never read from the database. The serializers are cached as
+    creating a schema is relatively slow.
+
+    Args:
+        schema_class: the Marshmallow schema class, e.g. EventSchema
+        fields: a tuple of field names
+    """
+    return RowSerializer(schema_class(only=fields))
@@ -2,7 +2,7 @@ from setuptools import setup
 
 setup(
     name="comp0034-week9-complete",
-    packages=["paralympic_app", "iris_app"],
+    packages=["paralympic_app", "iris_app", "app_common"],
     include_package_data=True,
     install_requires=[
         "flask",
@@ -15,4 +15,8 @@ setup(
         "requests",
         "scikit-learn",
     ],
+    extras_require={
+        # ASGI server for the read routes of the paralympic app, see asgi.py
+        "async": ["aiosqlite", "uvicorn"],
+    },
 )
@@ -0,0 +1,268 @@
+import csv
+import sqlite3
+import pytest
+from app_common import csv_loader
+
+
+def write_csv_file(path, rows):
+    """Writes the rows to a csv file and returns its path"""
+    with open(path, "w", newline="") as f:
+        csv.writer(f).writerows(rows)
+    return path
+
+
+def test_load_csv_in_chunks_converts_types(tmp_path):
+    """
+    GIVEN a csv file with a header and 7 rows, one with an empty value
+    WHEN it is loaded into a new table with INTEGER, REAL and TEXT columns, 3 rows at a
+        time, and then loaded again with and without replace
+    THEN every row should be in the table with the values converted to the column types
+        and the empty value as NULL
+    AND loading again should add the rows, or with replace, replace them
+    """
+    db_file = tmp_path.joinpath("load.db")
+    rows = [[str(i), f"{i}.5", f"name {i}"] for i in range(1, 8)]
+    rows[3][2] = ""
+    csv_file = write_csv_file(
+        tmp_path.joinpath("load.csv"), [["a", "b", "c"]] + rows
+    )
+    types = {"a": "INTEGER", "b": "REAL", "c": "TEXT"}
+
+    result = csv_loader.load_csv(
+        db_file, "loaded", csv_file, column_types=types, chunk_size=3
+    )
+    connection = sqlite3.connect(db_file)
+    loaded = connection.execute(
+        "SELECT a, b, c, typeof(a), typeof(b) FROM loaded ORDER BY rowid"
+    ).fetchall()
+    csv_loader.load_csv(db_file, "loaded", csv_file, chunk_size=3)
+    (added,) = connection.execute("SELECT count(*) FROM loaded").fetchone()
+    csv_loader.load_csv(db_file, "loaded", csv_file, replace=True)
+    (replaced,) = connection.execute("SELECT count(*) FROM loaded").fetchone()
+    connection.close()
+    assert result["table"] == "loaded"
+    assert result["rows"] == 7
+    assert [row[:3] for row in loaded] == [
+        (i, i + 0.5, None if i == 4 else f"name {i}") for i in range(1, 8)
+    ]
+    assert {row[3:] for row in loaded} == {("integer", "real")}
+    assert (added, replaced) == (14, 7)
+
+
+def test_load_csv_keeps_indexes(tmp_path):
+    """
+    GIVEN a table with an index
+    WHEN a csv file is loaded into it
+    THEN the index should be dropped during the load and created again after
+    """
+    db_file = tmp_path.joinpath("load.db")
+    connection = sqlite3.connect(db_file)
+    connection.execute("CREATE TABLE loaded (a INTEGER, b TEXT)")
+    connection.execute("CREATE INDEX ix_loaded_b ON loaded (b)")
+    connection.commit()
+    csv_file = write_csv_file(
+        tmp_path.joinpath("load.csv"), [["a", "b"], ["1", "x"], ["2", "y"]]
+    )
+    csv_loader.load_csv(db_file, "loaded", csv_file)
+    indexes = connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'"
+    ).fetchall()
+    connection.close()
+    assert indexes == [("ix_loaded_b",)]
+
+
+def test_load_csv_header_only(tmp_path):
+    """
+    GIVEN a csv file with only the column names
+    WHEN it is loaded into a new table
+    THEN the table should be created with no rows
+    """
+    db_file = tmp_path.joinpath("load.db")
+    csv_file = write_csv_file(tmp_path.joinpath("load.csv"), [["a", "b"]])
+    result = csv_loader.load_csv(db_file, "loaded", csv_file, column_types={})
+    connection = sqlite3.connect(db_file)
+    (count,) = connection.execute("SELECT count(*) FROM loaded").fetchone()
+    connection.close()
+    assert result["rows"] == count == 0
+
+
+@pytest.mark.parametrize(
+    "rows", [[], [["a", "b"], ["1", "x"], ["2"]]], ids=["empty", "short row"]
+)
+def test_load_csv_invalid_file_adds_nothing(tmp_path, rows):
+    """
+    GIVEN a WAL database with a table, and an empty csv file or one with a short row
+    WHEN the csv file is loaded into the table
+    THEN a ValueError should be raised, no rows should be added and the database should
+        still be in WAL mode
+    """
+    db_file = tmp_path.joinpath("load.db")
+    connection = sqlite3.connect(db_file)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("CREATE TABLE loaded (a INTEGER, b TEXT)")
+    connection.close()
+    csv_file = write_csv_file(tmp_path.joinpath("load.csv"), rows)
+    with pytest.raises(ValueError):
+        csv_loader.load_csv(db_file, "loaded", csv_file)
+    connection = sqlite3.connect(db_file)
+    (count,) = connection.execute("SELECT count(*) FROM loaded").fetchone()
+    (journal_mode,) = connection.execute("PRAGMA journal_mode").fetchone()
+    connection.close()
+    assert count == 0
+    assert journal_mode == "wal"
+
+
+def sync_counts(result):
+    """Returns the inserted, updated, deleted and unchanged counts of a sync"""
+    return tuple(
+        result[name]
+        for name in ("inserted", "updated", "deleted", "unchanged")
+    )
+
+
+def test_sync_csv_only_writes_changes(tmp_path):
+    """
+    GIVEN a csv file of 5 rows keyed on id
+    WHEN it is synced into a new table, synced again, and then synced after one row is
+        changed, one removed and one added
+    THEN the first sync should insert every row and the second leave every row unchanged
+    AND the last should update, delete and insert one row each and the table should
+        have the rows of the csv file
+    """
+    db_file = tmp_path.joinpath("sync.db")
+    csv_path = tmp_path.joinpath("sync.csv")
+    rows = [["id", "name", "value"]] + [
+        [str(i), f"name {i}", str(i * 10)] for i in range(1, 6)
+    ]
+    types = {"id": "INTEGER", "value": "INTEGER"}
+
+    def sync(rows):
+        csv_file = write_csv_file(csv_path, rows)
+        return csv_loader.sync_csv(
+            db_file,
+            "synced",
+            csv_file,
+            ["id"],
+            column_types=types,
+            chunk_size=2,
+        )
+
+    first = sync(rows)
+    second = sync(rows)
+    rows[3][1] = "changed"
+    del rows[4]
+    rows.append(["9", "", "90"])
+    third = sync(rows)
+    connection = sqlite3.connect(db_file)
+    synced = connection.execute(
+        "SELECT id, name, value FROM synced ORDER BY id"
+    ).fetchall()
+    connection.close()
+    assert first["rows"] == 5
+    assert sync_counts(first) == (5, 0, 0, 0)
+    assert sync_counts(second) == (0, 0, 0, 5)
+    assert sync_counts(third) == (1, 1, 1, 3)
+    assert synced == [
+        (1, "name 1", 10),
+        (2, "name 2", 20),
+        (3, "changed", 30),
+        (5, "name 5", 50),
+        (9, None, 90),
+    ]
+    assert sync_counts(sync(rows)) == (0, 0, 0, 5)
+
+
+def test_sync_csv_by_position(tmp_path):
+    """
+    GIVEN a table loaded from a csv file with load_csv, so without row hashes
+    WHEN it is synced from the file with the second row changed and the last removed,
+        without key columns, and then synced again
+    THEN the rows should be matched by position, every row written by the first sync
+    AND the second should leave every row unchanged
+    """
+    db_file = tmp_path.joinpath("sync.db")
+    csv_path = tmp_path.joinpath("sync.csv")
+    rows = [["name"], ["a"], ["b"], ["c"]]
+    csv_loader.load_csv(
+        db_file, "synced", write_csv_file(csv_path, rows), column_types={}
+    )
+    write_csv_file(csv_path, [["name"], ["a"], ["x"]])
+    first = csv_loader.sync_csv(db_file, "synced", csv_path)
+    second = csv_loader.sync_csv(db_file, "synced", csv_path)
+    connection = sqlite3.connect(db_file)
+    synced = connection.execute(
+        "SELECT rowid, name FROM synced ORDER BY rowid"
+    ).fetchall()
+    connection.close()
+    assert sync_counts(first) == (0, 2, 1, 0)
+    assert sync_counts(second) == (0, 0, 0, 2)
+    assert synced == [(1, "a"), (2, "x")]
+
+
+def test_sync_csv_removes_duplicate_keys_in_table(tmp_path):
+    """
+    GIVEN a table without a unique key, with two rows for key 1, loaded with load_csv
+    WHEN it is synced on the key from a csv file without the duplicate
+    THEN the duplicate row should be deleted, keeping the first, and a unique index
+        created on the key
+    AND add_unique_key() should then find the index and delete nothing
+    """
+    db_file = tmp_path.joinpath("sync.db")
+    csv_path = tmp_path.joinpath("sync.csv")
+    rows = [["id", "name"], ["1", "a"], ["2", "b"], ["1", "duplicate"]]
+    csv_loader.load_csv(
+        db_file, "synced", write_csv_file(csv_path, rows), column_types={}
+    )
+    write_csv_file(csv_path, rows[:3])
+    result = csv_loader.sync_csv(db_file, "synced", csv_path, ["id"])
+    connection = sqlite3.connect(db_file)
+    synced = connection.execute("SELECT id, name FROM synced").fetchall()
+    indexes = connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'"
+    ).fetchall()
+    deleted = csv_loader.add_unique_key(connection, "synced", ["id"])
+    connection.close()
+    assert sync_counts(result) == (0, 2, 1, 0)
+    assert sorted(synced) == [("1", "a"), ("2", "b")]
+    assert indexes == [("ix_synced_sync_key",)]
+    assert deleted == 0
+
+
+def test_add_unique_key_uses_primary_key(tmp_path):
+    """
+    GIVEN a table with a primary key on two columns
+    WHEN add_unique_key() is called for the columns
+    THEN no rows should be deleted and no index created
+    """
+    connection = sqlite3.connect(tmp_path.joinpath("sync.db"))
+    connection.execute(
+        "CREATE TABLE synced (a TEXT, b TEXT, PRIMARY KEY (b, a))"
+    )
+    deleted = csv_loader.add_unique_key(connection, "synced", ["a", "b"])
+    (indexes,) = connection.execute(
+        "SELECT count(*) FROM sqlite_master WHERE sql LIKE 'CREATE%INDEX%'"
+    ).fetchone()
+    connection.close()
+    assert deleted == 0
+    assert indexes == 0
+
+
+def test_sync_csv_duplicate_keys_in_file(tmp_path):
+    """
+    GIVEN a table synced from a csv file
+    WHEN it is synced from a csv file with two rows with the same key
+    THEN a ValueError should be raised and the table should be unchanged
+    """
+    db_file = tmp_path.joinpath("sync.db")
+    csv_path = tmp_path.joinpath("sync.csv")
+    rows = [["a", "b", "name"], ["1", "x", "first"], ["2", "x", "second"]]
+    csv_loader.sync_csv(
+        db_file, "synced", write_csv_file(csv_path, rows), ["a", "b"], {}
+    )
+    write_csv_file(csv_path, rows + [["1", "x", "again"]])
+    with pytest.raises(ValueError, match="Row 4"):
+        csv_loader.sync_csv(db_file, "synced", csv_path, ["a", "b"])
+    connection = sqlite3.connect(db_file)
+    synced = connection.execute("SELECT a, b, name FROM synced").fetchall()
+    connection.close()
+    assert sorted(synced) == [("1", "x", "first"), ("2", "x", "second")]
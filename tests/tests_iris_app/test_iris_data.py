@@ -0,0 +1,66 @@
+import csv
+import sqlite3
+from iris_app.data import generate_data
+
+
+def test_generate_rows_same_seed_same_rows():
+    """
+    GIVEN the iris model fitted to iris.csv
+    WHEN rows are generated twice with the same seed, and once with another seed
+    THEN the rows with the same seed should be the same and with the other seed not
+    """
+
+    def rows(seed):
+        return list(generate_data.generate_rows(seed, 50, 20))
+
+    assert rows(1) == rows(1)
+    assert rows(1) != rows(2)
+
+
+def test_generate_rows_in_chunks():
+    """
+    GIVEN the iris model fitted to iris.csv
+    WHEN 50 rows are generated in chunks of 20
+    THEN there should be chunks of 20, 20 and 10 rows
+    AND each row should have measurements of at least 0.1 and a species from iris.csv
+    """
+    chunks = list(generate_data.generate_rows(1, 50, 20))
+    rows = [r for chunk in chunks for r in chunk]
+    species = set(generate_data.IrisModel().species)
+    assert [len(chunk) for chunk in chunks] == [20, 20, 10]
+    assert {len(r) for r in rows} == {len(generate_data.COLUMNS)}
+    assert min(min(r[:-1]) for r in rows) >= 0.1
+    assert {r[-1] for r in rows} <= species
+
+
+def test_write_csv_writes_all_rows(tmp_path):
+    """
+    GIVEN 25 generated rows in chunks of 10
+    WHEN they are written as a csv file
+    THEN the file should have the columns of iris.csv and every row
+    """
+    csv_file = tmp_path.joinpath("iris.csv")
+    written = generate_data.write_csv(
+        csv_file, generate_data.generate_rows(1, 25, 10)
+    )
+    with open(csv_file, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert written == len(rows) == 25
+    assert list(rows[0]) == generate_data.COLUMNS
+
+
+def test_write_sqlite_writes_all_rows(tmp_path):
+    """
+    GIVEN 25 generated rows in chunks of 10
+    WHEN they are written to a new SQLite database
+    THEN the iris table should have the rows
+    """
+    db_file = tmp_path.joinpath("iris.db")
+    chunks = list(generate_data.generate_rows(1, 25, 10))
+    written = generate_data.write_sqlite(db_file, chunks)
+    connection = sqlite3.connect(db_file)
+    columns = ", ".join(generate_data.COLUMNS)
+    rows = connection.execute(f"SELECT {columns} FROM iris").fetchall()
+    connection.close()
+    assert written == 25
+    assert sorted(rows) == sorted(r for chunk in chunks for r in chunk)
@@ -1,5 +1,12 @@
-from iris_app.models import User
-from iris_app import db
+import csv
+import gzip
+import io
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from sqlalchemy import exc, text
+from iris_app.models import Iris, User
+from iris_app.prediction_model import LazyModel
+from iris_app import db, PROJECT_ROOT
 
 
 def test_index_success(test_client):
@@ -85,3 +92,102 @@ def test_error_when_register_form_email_format_not_valid(test_client):
     response = test_client.post("/register", data=form_data)
     assert response.status_code == 200
     assert "This field is required." in response.data.decode()
+
+
+def test_static_css_gzip(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN the bootstrap css file is requested with the header Accept-Encoding: gzip
+    THEN the response should be gzip compressed and smaller than the file
+    """
+    response = test_client.get(
+        "/static/css/bootstrap.min.css", headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    css_file = PROJECT_ROOT.joinpath("static", "css", "bootstrap.min.css")
+    assert gzip.decompress(response.data) == css_file.read_bytes()
+    assert len(response.data) < css_file.stat().st_size
+
+
+def test_metrics_records_requests(test_client):
+    """
+    GIVEN a running Flask app with METRICS_ENABLED
+    WHEN the iris list page is requested and then '/metrics'
+    THEN the metrics should include the request count and latency histogram of the page in the Prometheus format
+    """
+    test_client.get("/iris")
+    response = test_client.get("/metrics")
+    text = response.data.decode()
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert (
+        'http_requests_total{endpoint="iris_list",method="GET",status="200"}'
+        in text
+    )
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    assert (
+        'http_request_queries_count{endpoint="iris_list",method="GET"}' in text
+    )
+
+
+def test_metrics_failed_query_not_left_open(app):
+    """
+    GIVEN a running Flask app with METRICS_ENABLED
+    WHEN a SQL statement fails
+    THEN the start time of the statement should not be left on the connection
+    """
+    with db.engine.connect() as connection:
+        with pytest.raises(exc.OperationalError):
+            connection.execute(text("SELECT * FROM no_such_table"))
+        assert "metrics_query_start" not in connection.info
+        connection.execute(text("SELECT 1"))
+        assert "metrics_query_start" not in connection.info
+
+
+def test_predict_returns_species(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN '/predict' is requested with the measurements of a setosa
+    THEN the response should be the predicted species as text
+    """
+    query = "sep-len=5.1&sep-wid=3.5&pet-len=1.4&pet-wid=0.2"
+    response = test_client.get(f"/predict?{query}")
+    assert response.status_code == 200
+    assert response.data.decode() == "iris-setosa"
+
+
+def test_iris_csv_same_columns_as_data(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN '/iris.csv' is requested, or '/iris' with the header Accept: text/csv
+    THEN the response should be CSV with the same header as data/iris.csv
+    AND one row for each iris in the database
+    """
+    response = test_client.get("/iris.csv")
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    with open(
+        PROJECT_ROOT.joinpath("data", "iris.csv"), encoding="utf-8-sig"
+    ) as f:
+        assert rows[0] == next(csv.reader(f))
+    count = db.session.execute(db.select(db.func.count()).select_from(Iris))
+    assert len(rows) - 1 == count.scalar()
+    accept = test_client.get("/iris", headers={"Accept": "text/csv"})
+    assert accept.data == response.data
+
+
+def test_model_loaded_once_on_first_use():
+    """
+    GIVEN a LazyModel for the pickled prediction model
+    WHEN it is created and then used by several threads at once
+    THEN it should only be loaded on first use, and every thread should get the same model
+    """
+    model = LazyModel(PROJECT_ROOT.joinpath("data", "model_lr.pkl"))
+    assert not model.loaded
+    with ThreadPoolExecutor(8) as executor:
+        models = list(executor.map(lambda _: model.get(), range(8)))
+    assert model.loaded
+    assert all(m is models[0] for m in models)
+    assert model.predict([[5.1, 3.5, 1.4, 0.2]])[0] == 0
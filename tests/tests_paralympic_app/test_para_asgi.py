@@ -0,0 +1,131 @@
+import asyncio
+import json
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from paralympic_app.asgi import AsyncReadApp
+
+
+def asgi_request(asgi_app, method, path, query_string=b"", body=b""):
+    """Sends a request to an ASGI app and returns the status, headers and body"""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query_string,
+        "headers": [(b"content-type", b"application/json")],
+        "http_version": "1.1",
+        "root_path": "",
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body}
+
+    async def send(message):
+        messages.append(message)
+
+    async def call():
+        await asgi_app(scope, receive, send)
+        await asgi_app.engine.dispose()
+
+    asyncio.run(call())
+    headers = {k.decode(): v.decode() for k, v in messages[0]["headers"]}
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return messages[0]["status"], headers, body
+
+
+@pytest.mark.parametrize(
+    "path, query_string",
+    [
+        ("/event", b"year_min=2000&sort=-year"),
+        ("/event/1", b"fields=year,location"),
+        ("/noc", b""),
+        ("/noc/GBR", b""),
+        ("/noc/XXX", b""),
+    ],
+)
+def test_asgi_read_routes_same_as_flask(app, test_client, path, query_string):
+    """
+    GIVEN the ASGI app for the paralympic app
+    WHEN one of the async read routes is requested
+    THEN the status, body and ETag should be the same as from the Flask app
+    """
+    status, headers, body = asgi_request(
+        AsyncReadApp(app), "GET", path, query_string
+    )
+    response = test_client.get(path, query_string=query_string.decode())
+    assert status == response.status_code
+    assert json.loads(body) == response.json
+    assert headers.get("etag") == response.headers.get("ETag")
+
+
+def test_asgi_passes_other_requests_to_flask(app, test_client):
+    """
+    GIVEN the ASGI app for the paralympic app
+    WHEN a PATCH request is sent
+    THEN it should be handled by the Flask app and the change seen by the async routes
+    """
+    asgi_app = AsyncReadApp(app)
+    original = test_client.get("/noc/FRA").json["notes"]
+    changes = json.dumps({"notes": "Async"}).encode()
+    status, _, _ = asgi_request(asgi_app, "PATCH", "/noc/FRA", body=changes)
+    _, _, body = asgi_request(asgi_app, "GET", "/noc/FRA")
+    test_client.patch("/noc/FRA", json={"notes": original})
+    assert status == 200
+    assert json.loads(body)["notes"] == "Async"
+
+
+def test_asgi_streams_csv_from_flask(app, test_client):
+    """
+    GIVEN the ASGI app for the paralympic app
+    WHEN '/event.csv' is requested, a streamed response from the Flask app
+    THEN the body should be the same as from the Flask app
+    """
+    status, headers, body = asgi_request(
+        AsyncReadApp(app), "GET", "/event.csv", b"year_min=2000"
+    )
+    assert status == 200
+    assert headers["content-type"].startswith("text/csv")
+    assert body == test_client.get("/event.csv?year_min=2000").data
+
+
+def test_asgi_streams_ndjson_from_flask(app, test_client):
+    """
+    GIVEN the ASGI app for the paralympic app
+    WHEN '/event?stream=1' is requested, a response from the Flask app streamed with
+        stream_with_context() that queries the database while it is sent
+    THEN every event should be sent, the same as from the Flask app
+    """
+    status, headers, body = asgi_request(
+        AsyncReadApp(app), "GET", "/event", b"stream=1&fields=event_id,year"
+    )
+    expected = test_client.get("/event?stream=1&fields=event_id,year")
+    rows = [json.loads(line) for line in body.decode().splitlines()]
+    assert status == 200
+    assert headers["content-type"] == "application/x-ndjson"
+    assert rows == [json.loads(line) for line in expected.text.splitlines()]
+    assert len(rows) == len(test_client.get("/event").json)
+
+
+def test_asgi_queries_in_metrics(app, test_client):
+    """
+    GIVEN the ASGI app for the paralympic app with METRICS_ENABLED
+    WHEN '/event/4' is requested with a new set of fields, so it isn't cached
+    THEN the query of the async view should be recorded in the metrics of the route
+    """
+
+    def query_count():
+        name = 'http_request_queries_sum{endpoint="event_id",method="GET"}'
+        for line in test_client.get("/metrics").data.decode().splitlines():
+            if line.startswith(name):
+                return float(line.split()[-1])
+        return 0
+
+    before = query_count()
+    status, _, _ = asgi_request(
+        AsyncReadApp(app), "GET", "/event/4", b"fields=year,type,start"
+    )
+    assert status == 200
+    assert query_count() - before == 1
@@ -0,0 +1,18 @@
+from sqlalchemy import create_engine, text
+from paralympic_app import config, set_sqlite_pragmas
+
+
+def test_prod_config_sqlite_pragmas(tmp_path):
+    """
+    GIVEN an engine for a new SQLite database with the ProdConfig pragmas set
+    WHEN a connection is made
+    THEN the journal mode should be WAL and synchronous should be NORMAL (1)
+    """
+    engine = create_engine("sqlite:///" + str(tmp_path.joinpath("prod.db")))
+    set_sqlite_pragmas(engine, config.ProdConfig.SQLITE_PRAGMAS)
+    with engine.connect() as connection:
+        journal_mode = connection.execute(text("PRAGMA journal_mode")).scalar()
+        synchronous = connection.execute(text("PRAGMA synchronous")).scalar()
+    engine.dispose()
+    assert journal_mode == "wal"
+    assert synchronous == 1
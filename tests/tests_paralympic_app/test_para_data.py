@@ -0,0 +1,105 @@
+import csv
+import sqlite3
+from paralympic_app.data import generate_data
+
+
+def test_generate_events_same_seed_same_rows():
+    """
+    GIVEN the regions in regions.csv
+    WHEN events are generated twice with the same seed, and once with another seed
+    THEN the events with the same seed should be the same and with the other seed not
+    """
+    nocs = [r["NOC"] for r in generate_data.generate_regions(0)]
+
+    def events(seed):
+        return list(generate_data.generate_events(seed, 50, 1, nocs, 20))
+
+    assert events(1) == events(1)
+    assert events(1) != events(2)
+
+
+def test_generate_events_in_chunks():
+    """
+    GIVEN the regions in regions.csv
+    WHEN 50 events are generated in chunks of 20 starting at event_id 11
+    THEN there should be chunks of 20, 20 and 10 events with consecutive ids
+    AND each event should have a value for each of the event columns
+    """
+    nocs = [r["NOC"] for r in generate_data.generate_regions(0)]
+    chunks = list(generate_data.generate_events(1, 50, 11, nocs, 20))
+    events = [e for chunk in chunks for e in chunk]
+    assert [len(chunk) for chunk in chunks] == [20, 20, 10]
+    assert [e[0] for e in events] == list(range(11, 61))
+    assert {len(e) for e in events} == {len(generate_data.EVENT_COLUMNS)}
+
+
+def test_generate_regions_extra_codes_unique():
+    """
+    GIVEN the regions in regions.csv
+    WHEN 30 extra regions are generated
+    THEN there should be 30 more regions and every NOC should be unique
+    """
+    regions = generate_data.generate_regions(0)
+    more = generate_data.generate_regions(30)
+    nocs = [r["NOC"] for r in more]
+    assert len(more) == len(regions) + 30
+    assert len(set(nocs)) == len(nocs)
+
+
+def test_write_csv_writes_all_rows(tmp_path):
+    """
+    GIVEN generated regions and 25 events in chunks of 10
+    WHEN they are written as csv files
+    THEN regions.csv and events.csv should have the columns and every row
+    AND the NOC of each event should be one of the regions
+    """
+    regions = generate_data.generate_regions(5)
+    nocs = [r["NOC"] for r in regions]
+    written = generate_data.write_csv(
+        tmp_path,
+        regions,
+        lambda first_id: generate_data.generate_events(
+            1, 25, first_id, nocs, 10
+        ),
+    )
+    with open(tmp_path.joinpath("events.csv"), newline="") as f:
+        events = list(csv.DictReader(f))
+    with open(tmp_path.joinpath("regions.csv"), newline="") as f:
+        written_regions = list(csv.DictReader(f))
+    assert written == len(events) == 25
+    assert list(events[0]) == generate_data.EVENT_COLUMNS
+    assert [r["NOC"] for r in written_regions] == nocs
+    assert {e["NOC"] for e in events} <= set(nocs)
+
+
+def test_write_sqlite_events_reference_regions(tmp_path):
+    """
+    GIVEN generated regions and 25 events in chunks of 10
+    WHEN they are written to a new SQLite database, and then 5 more events
+    THEN the database should have all the events with consecutive ids
+    AND the NOC of every event should be a region in the database
+    """
+    db_file = tmp_path.joinpath("generated.db")
+    regions = generate_data.generate_regions(5)
+    nocs = [r["NOC"] for r in regions]
+
+    def events(count):
+        return lambda first_id: generate_data.generate_events(
+            1, count, first_id, nocs, 10
+        )
+
+    written = generate_data.write_sqlite(db_file, regions, events(25))
+    added = generate_data.write_sqlite(db_file, regions, events(5))
+    connection = sqlite3.connect(db_file)
+    ids = [r[0] for r in connection.execute("SELECT event_id FROM event")]
+    (missing,) = connection.execute(
+        "SELECT count(*) FROM event WHERE NOC NOT IN (SELECT NOC FROM region)"
+    ).fetchone()
+    (region_count,) = connection.execute(
+        "SELECT count(*) FROM region"
+    ).fetchone()
+    connection.close()
+    assert (written, added) == (25, 5)
+    assert sorted(ids) == list(range(1, 31))
+    assert missing == 0
+    assert region_count == len(regions)
@@ -1,5 +1,11 @@
-from paralympic_app.models import Region
-from paralympic_app.schemas import RegionSchema
+import csv
+import gzip
+import io
+import json
+import pytest
+from paralympic_app.models import Event, Region
+from paralympic_app.schemas import EventSchema, RegionSchema
+from sqlalchemy import exc, text
 from paralympic_app import db
 
 
@@ -100,3 +106,746 @@ def test_delete_region(test_client):
     url = f"/noc/{region.NOC}"
     response = test_client.delete(url)
     assert b'"Successfully deleted":"ZZZ"' in response.data
+
+
+def test_get_events_paged(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP GET request is made to '/event?limit=2'
+    AND the 'next' link in the response is followed
+    THEN each page should contain 2 events with the event_id in ascending order
+    AND the second page should start after the last event on the first page
+    """
+    response = test_client.get("/event?limit=2")
+    assert response.status_code == 200
+    page_1 = response.json
+    assert [e["event_id"] for e in page_1["data"]] == [1, 2]
+    assert page_1["next"] is not None
+
+    page_2 = test_client.get(page_1["next"]).json
+    assert [e["event_id"] for e in page_2["data"]] == [3, 4]
+
+
+def test_get_regions_paged_last_page(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP GET request is made to '/noc' with an 'after' value beyond the last NOC code
+    THEN the page should be empty and the 'next' link should be null
+    """
+    response = test_client.get("/noc?after=ZZZZ")
+    assert response.status_code == 200
+    assert response.json == {"data": [], "next": None}
+
+
+def test_get_events_paged_invalid_limit(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP GET request is made to '/event' with a limit that is not a number
+    THEN the status code should be 400
+    """
+    response = test_client.get("/event?limit=ten")
+    assert response.status_code == 400
+
+
+def test_get_region_not_modified(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN '/noc/GBR' is requested again with the ETag from the first response in If-None-Match
+    THEN the status code should be 304 and the response should have no body
+    """
+    response = test_client.get("/noc/GBR")
+    etag = response.headers["ETag"]
+    assert response.last_modified is not None
+
+    response = test_client.get("/noc/GBR", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+def test_get_region_etag_changes_after_update(test_client):
+    """
+    GIVEN a running Flask app and the ETag for '/noc/GBR'
+    WHEN the GBR region is updated with an HTTP PATCH request
+    THEN a request for '/noc/GBR' with the old ETag should return 200 with a new ETag
+    """
+    etag = test_client.get("/noc/GBR").headers["ETag"]
+    test_client.patch("/noc/GBR", json={"region": "UK"})
+
+    response = test_client.get("/noc/GBR", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_get_event_etag_changes_after_region_update(test_client):
+    """
+    GIVEN a running Flask app and the ETag for '/event/1', which includes its region
+    WHEN the region of event 1 is updated with an HTTP PATCH request
+    THEN a request for '/event/1' with the old ETag should return 200 with a new ETag
+    """
+    etag = test_client.get("/event/1").headers["ETag"]
+    notes = test_client.get("/noc/ITA").json["notes"]
+    test_client.patch("/noc/ITA", json={"notes": "Changed"})
+
+    response = test_client.get("/event/1", headers={"If-None-Match": etag})
+    test_client.patch("/noc/ITA", json={"notes": notes})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_event_cached_and_invalidated_by_update(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN event 1 is requested twice
+    THEN the second request should be a cache hit
+    AND WHEN event 1 is updated with an HTTP PATCH request
+    THEN the next request for event 1 should be a cache miss
+    """
+    test_client.get("/event/1")
+    before = test_client.get("/cache/stats").json["event"]
+    test_client.get("/event/1")
+    after = test_client.get("/cache/stats").json["event"]
+    assert after["hits"] == before["hits"] + 1
+
+    test_client.patch("/event/1", json={"year": 1960})
+    test_client.get("/event/1")
+    after_update = test_client.get("/cache/stats").json["event"]
+    assert after_update["misses"] == after["misses"] + 1
+
+
+def test_event_page_with_leading_zero_invalidated_by_update(test_client):
+    """
+    GIVEN a running Flask app and the event page '/display_event/02'
+    WHEN event 2 is updated with an HTTP PATCH request to '/event/2'
+    THEN '/display_event/02' should show the updated event
+    """
+    location = test_client.get("/event/2").json["location"]
+    test_client.get("/display_event/02")
+    test_client.patch("/event/2", json={"location": "Changed"})
+
+    response = test_client.get("/display_event/02")
+    test_client.patch("/event/2", json={"location": location})
+    assert b"Changed" in response.data
+
+
+def test_patch_event_with_non_integer_id_invalidates_cache(test_client):
+    """
+    GIVEN a running Flask app and event 1 in the cache
+    WHEN event 1 is updated with an HTTP PATCH request to '/event/1.0'
+    THEN the update should succeed and '/event/1' should return the updated event
+    """
+    highlights = test_client.get("/event/1").json["highlights"]
+    response = test_client.patch("/event/1.0", json={"highlights": "Changed"})
+    updated = test_client.get("/event/1").json["highlights"]
+    test_client.patch("/event/1", json={"highlights": highlights})
+    assert response.status_code == 200
+    assert updated == "Changed"
+
+
+def test_event_read_during_update_not_cached(test_client, monkeypatch):
+    """
+    GIVEN a running Flask app
+    WHEN '/event/5' is requested and event 5 is updated after the request has read it
+        from the database but before it is cached, as by a concurrent PATCH request
+    THEN the next request for '/event/5' should return the updated event
+    """
+    from paralympic_app.routes import event_serializer, invalidate_events
+    from paralympic_app.cache import bump_version
+
+    highlights = test_client.get("/event/5").json["highlights"]
+    # So the next request reads the event from the database
+    invalidate_events(5)
+    dump_row = event_serializer.dump_row
+
+    def dump_row_then_update(row):
+        result = dump_row(row)
+        db.session.execute(
+            db.update(Event)
+            .where(Event.event_id == 5)
+            .values(highlights="Concurrent")
+        )
+        db.session.commit()
+        bump_version("event")
+        invalidate_events(5)
+        return result
+
+    monkeypatch.setattr(event_serializer, "dump_row", dump_row_then_update)
+    test_client.get("/event/5")
+    monkeypatch.undo()
+    updated = test_client.get("/event/5").json["highlights"]
+    test_client.patch("/event/5", json={"highlights": highlights})
+    assert updated == "Concurrent"
+
+
+def test_cached_event_invalidated_by_region_delete(test_client):
+    """
+    GIVEN a running Flask app and a cached event for the region ZZZ
+    WHEN the ZZZ region is deleted with an HTTP DELETE request
+    THEN the event should be returned without its region
+    """
+    test_client.post("/noc", json={"NOC": "ZZZ", "region": "Test"})
+    event_id = db.session.execute(
+        db.insert(Event).returning(Event.event_id),
+        {
+            "type": "Summer",
+            "year": 2100,
+            "location": "Test",
+            "NOC": "ZZZ",
+            "start": "01-Jan-00",
+            "end": "02-Jan-00",
+            "disabilities_included": "",
+            "events": "1",
+            "sports": "1",
+            "countries": 1,
+            "male": 1,
+            "female": 1,
+            "participants": 2,
+        },
+    ).scalar_one()
+    db.session.commit()
+    assert test_client.get(f"/event/{event_id}").json["region"] == "ZZZ"
+
+    test_client.delete("/noc/ZZZ")
+    response = test_client.get(f"/event/{event_id}")
+    db.session.execute(db.delete(Event).where(Event.event_id == event_id))
+    db.session.commit()
+    assert response.json["region"] is None
+
+
+def test_add_regions_bulk(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP POST request is made to '/noc/bulk' with a JSON array of 3 regions
+    where one is valid, one is missing the region name and one has an existing NOC code
+    THEN the status code should be 207
+    AND the status of each region should be 201, 400 and 409 respectively
+    AND only the valid region should be added to the database
+    """
+    regions = [
+        {"NOC": "BK1", "region": "Bulk region 1"},
+        {"NOC": "BK2"},
+        {"NOC": "GBR", "region": "UK"},
+    ]
+    response = test_client.post("/noc/bulk", json=regions)
+    assert response.status_code == 207
+    assert [r["status"] for r in response.json["results"]] == [201, 400, 409]
+    assert db.session.get(Region, "BK1") is not None
+    assert db.session.get(Region, "BK2") is None
+
+    db.session.execute(db.delete(Region).where(Region.NOC == "BK1"))
+    db.session.commit()
+
+
+def test_add_regions_bulk_ndjson(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP POST request is made to '/noc/bulk' with an NDJSON body of 2 regions
+    THEN the status code should be 201 and both regions should be added to the database
+    """
+    body = (
+        '{"NOC": "BK3", "region": "Bulk region 3"}\n'
+        '{"NOC": "BK4", "region": "Bulk region 4"}\n'
+    )
+    response = test_client.post(
+        "/noc/bulk", data=body, content_type="application/x-ndjson"
+    )
+    assert response.status_code == 201
+    assert response.json["created"] == 2
+
+    db.session.execute(db.delete(Region).where(Region.NOC.in_(["BK3", "BK4"])))
+    db.session.commit()
+
+
+def test_get_events_stream(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP GET request is made to '/event' with the header Accept: application/x-ndjson
+    THEN the content type should be application/x-ndjson
+    AND each line of the response should be the JSON for one event in the same format as '/event'
+    """
+    response = test_client.get(
+        "/event", headers={"Accept": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == test_client.get(
+        "/event"
+    ).json
+
+
+def test_get_regions_stream_query_parameter(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP GET request is made to '/noc?stream=1'
+    THEN the response should be NDJSON with one line per region
+    """
+    response = test_client.get("/noc?stream=1")
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == len(test_client.get("/noc").json)
+
+
+def test_get_events_csv_filtered(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP GET request is made to '/event.csv' with filters and fields
+    THEN the response should be CSV with a header row of the fields in table order
+    AND one row for each event returned by '/event' with the same query parameters
+    """
+    query = "type=Winter&fields=year,event_id,NOC&sort=-year"
+    response = test_client.get(f"/event.csv?{query}")
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    assert "attachment" in response.headers["Content-Disposition"]
+    reader = csv.reader(io.StringIO(response.get_data(as_text=True)))
+    assert next(reader) == ["event_id", "year", "NOC"]
+    expected = test_client.get(f"/event?{query}").json
+    assert list(reader) == [
+        [str(e["event_id"]), str(e["year"]), e["NOC"]] for e in expected
+    ]
+
+
+def test_get_events_accept_csv(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP GET request is made to '/event' with the header Accept: text/csv
+    THEN the response should be the same CSV as '/event.csv'
+    """
+    response = test_client.get(
+        "/event?year_min=2000", headers={"Accept": "text/csv"}
+    )
+    assert response.mimetype == "text/csv"
+    assert response.data == test_client.get("/event.csv?year_min=2000").data
+
+
+def test_fast_serializers_same_as_schemas(test_client):
+    """
+    GIVEN the events and regions in the database
+    WHEN they are serialised with the fast RowSerializer and with the Marshmallow schemas
+    THEN the results should be identical
+    """
+    from paralympic_app.routes import event_serializer, region_serializer
+
+    events = db.session.execute(
+        db.select(Event).order_by(Event.event_id)
+    ).scalars()
+    query = event_serializer.select().order_by(Event.event_id)
+    assert event_serializer.dump(query) == EventSchema(many=True).dump(events)
+
+    regions = db.session.execute(
+        db.select(Region).order_by(Region.NOC)
+    ).scalars()
+    query = region_serializer.select().order_by(Region.NOC)
+    assert region_serializer.dump(query) == regions_schema.dump(regions)
+
+
+def test_get_events_sparse_fields(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP GET request is made to '/event?fields=event_id,year'
+    THEN each event in the response should have only the event_id and year fields
+    """
+    response = test_client.get("/event?fields=event_id,year")
+    assert response.status_code == 200
+    assert all(set(e) == {"event_id", "year"} for e in response.json)
+
+
+def test_get_event_sparse_fields_invalid(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP GET request is made to '/event/1' with a field that does not exist in 'fields'
+    THEN the status code should be 400
+    """
+    response = test_client.get("/event/1?fields=year,not_a_field")
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("path", ["/event", "/event/1", "/noc"])
+@pytest.mark.parametrize("fields", [",", " ", " , "])
+def test_sparse_fields_empty(test_client, path, fields):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP GET request is made with a 'fields' parameter that has no field names
+    THEN the status code should be 400
+    """
+    response = test_client.get(path, query_string={"fields": fields})
+    assert response.status_code == 400
+    assert response.json["message"] == "fields must include at least one field"
+
+
+def test_get_regions_paged_sparse_fields(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP GET request is made to '/noc?limit=2&fields=region' which excludes the NOC key
+    THEN the page should contain only the region field
+    AND the 'next' link should still continue after the last NOC on the page
+    """
+    page_1 = test_client.get("/noc?limit=2&fields=region").json
+    assert page_1["data"] == [{"region": "Afghanistan"}, {"region": "Curacao"}]
+    page_2 = test_client.get(page_1["next"]).json
+    assert page_2["data"][0] == {"region": "Albania"}
+
+
+def test_get_events_filtered_and_sorted(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP GET request is made to '/event' for Summer events from 2000 to 2012 sorted by year descending
+    THEN the response should contain only Summer events in that range, with the latest first
+    """
+    response = test_client.get(
+        "/event?type=Summer&year_min=2000&year_max=2012&sort=-year"
+    )
+    assert response.status_code == 200
+    events = response.json
+    assert [e["year"] for e in events] == [2012, 2008, 2004, 2000]
+    assert all(e["type"] == "Summer" for e in events)
+
+
+def test_get_events_filter_invalid_year(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP GET request is made to '/event' with a year that isn't a number
+    THEN the status code should be 400
+    """
+    response = test_client.get("/event?year=last")
+    assert response.status_code == 400
+
+
+def test_event_indexes_in_database(test_client):
+    """
+    GIVEN the paralympics database
+    WHEN the indexes on the event table are listed
+    THEN there should be the indexes on the year, type and NOC columns
+    """
+    indexes = db.session.execute(db.text("PRAGMA index_list(event)")).all()
+    index_names = {index.name for index in indexes}
+    assert {"ix_event_year", "ix_event_type", "ix_event_NOC"} <= index_names
+
+
+def test_event_stats_grouped_by_type(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP GET request is made to '/event/stats?group_by=type'
+    THEN there should be one row per event type
+    AND the number of games and participants should match the totals of the events from '/event'
+    """
+    events = test_client.get("/event").json
+    response = test_client.get("/event/stats?group_by=type")
+    assert response.status_code == 200
+    for row in response.json:
+        of_type = [e for e in events if e["type"] == row["type"]]
+        assert row["games"] == len(of_type)
+        assert row["participants"] == sum(e["participants"] for e in of_type)
+
+
+def test_event_stats_invalid_group(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an HTTP GET request is made to '/event/stats' grouped by a column that isn't supported
+    THEN the status code should be 400
+    """
+    response = test_client.get("/event/stats?group_by=highlights")
+    assert response.status_code == 400
+
+
+def test_get_all_regions_query_count_constant(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN '/noc' is requested before and after 20 more regions are added
+    THEN the number of SQL queries run should be the same, i.e. there are no queries per region
+    """
+    before = test_client.get("/noc").headers["X-Query-Count"]
+    regions = [{"NOC": f"Q{i:02}", "region": f"Region {i}"} for i in range(20)]
+    test_client.post("/noc/bulk", json=regions)
+    after = test_client.get("/noc").headers["X-Query-Count"]
+
+    db.session.execute(
+        db.delete(Region).where(Region.NOC.in_([r["NOC"] for r in regions]))
+    )
+    db.session.commit()
+    assert after == before
+
+
+def test_get_events_single_query(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN '/event' is requested with filters that aren't cached
+    THEN the events and their regions should be fetched with a single SQL query
+    """
+    response = test_client.get("/event?year_min=1900&type=Summer")
+    assert response.headers["X-Query-Count"] == "1"
+
+
+def test_get_region_events(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN the "/noc/<code>/events" route is requested with the GBR code
+    THEN the response should contain the region UK and the events hosted by GBR
+    AND the region and events should be fetched with a single SQL query
+    """
+    response = test_client.get("/noc/GBR/events")
+    assert response.status_code == 200
+    assert response.headers["X-Query-Count"] == "1"
+    assert response.json["region"]["region"] == "UK"
+    assert "London" in [e["location"] for e in response.json["events"]]
+    assert all(e["NOC"] == "GBR" for e in response.json["events"])
+
+
+def test_get_specific_region_embed_events(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN the "/noc/<code>?embed=events" route is requested with a code that doesn't exist
+    THEN the status code should be 404
+    """
+    response = test_client.get("/noc/XXX?embed=events")
+    assert response.status_code == 404
+
+
+def test_get_specific_region_embed_events_found(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN the "/noc/<code>?embed=events" route is requested with the GBR code
+    THEN the response should contain the region UK with an "events" list of the events
+        hosted by GBR
+    AND the region and events should be fetched with a single SQL query
+    """
+    response = test_client.get("/noc/GBR?embed=events")
+    assert response.status_code == 200
+    assert response.headers["X-Query-Count"] == "1"
+    assert response.json["NOC"] == "GBR"
+    assert response.json["region"] == "UK"
+    events = response.json["events"]
+    assert "London" in [e["location"] for e in events]
+    assert all(e["NOC"] == "GBR" for e in events)
+    assert events == test_client.get("/noc/GBR/events").json["events"]
+
+
+def test_get_events_gzip(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN '/event' is requested with the header Accept-Encoding: gzip
+    THEN the response should be gzip compressed with a weak ETag
+    AND the decompressed response should be the same as the uncompressed response
+    """
+    response = test_client.get("/event", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"].startswith("W/")
+    uncompressed = test_client.get("/event")
+    assert gzip.decompress(response.data) == uncompressed.data
+
+
+def test_small_response_not_compressed(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN '/noc/GBR' is requested with the header Accept-Encoding: gzip
+    THEN the response should not be compressed as it is smaller than COMPRESS_MIN_SIZE
+    """
+    response = test_client.get("/noc/GBR", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_event_page_cached_until_event_updated(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN the event detail page for event 2 is requested twice
+    THEN the second request should be served from the page cache
+    AND WHEN event 2 is updated
+    THEN the page should be rendered again with the new details
+    """
+    test_client.get("/display_event/2")
+    hits = test_client.get("/cache/stats").json["page"]["hits"]
+    test_client.get("/display_event/2")
+    assert test_client.get("/cache/stats").json["page"]["hits"] == hits + 1
+
+    original = test_client.get("/event/2").json["highlights"]
+    test_client.patch("/event/2", json={"highlights": "Updated highlights"})
+    response = test_client.get("/display_event/2")
+    test_client.patch("/event/2", json={"highlights": original})
+    assert b"Updated highlights" in response.data
+
+
+def test_events_near_same_as_all_events_within_radius(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN '/event/near' is requested for 2000km around Rome
+    THEN the events returned should be exactly the events from '/event' within 2000km, nearest first
+    """
+    from paralympic_app.routes import haversine_km
+
+    located = [e for e in test_client.get("/event").json if e["lat"]]
+    distances = {
+        e["event_id"]: haversine_km(41.9, 12.5, e["lat"], e["lon"])
+        for e in located
+    }
+    expected = sorted(
+        (id for id, distance in distances.items() if distance <= 2000),
+        key=distances.get,
+    )
+    response = test_client.get("/event/near?lat=41.9&lon=12.5&radius_km=2000")
+    assert response.status_code == 200
+    assert [e["event_id"] for e in response.json] == expected
+    assert len(expected) > 0
+
+
+def test_events_near_missing_radius(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN '/event/near' is requested without a radius_km
+    THEN the status code should be 400
+    """
+    response = test_client.get("/event/near?lat=41.9&lon=12.5")
+    assert response.status_code == 400
+
+
+def test_event_search_ranked_with_snippet(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN '/event/search?q=wheelchair rugby' is requested
+    THEN the 2000 Sydney event should be returned with a rank and the matches highlighted in the snippet
+    """
+    response = test_client.get("/event/search?q=wheelchair rugby")
+    assert response.status_code == 200
+    assert [e["year"] for e in response.json] == [2000]
+    assert "<b>Rugby</b>" in response.json[0]["snippet"]
+    assert response.json[0]["rank"] < 0
+
+
+def test_event_search_follows_updates(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN the highlights of event 3 are updated with a new word
+    THEN '/event/search' should find event 3 by the new word and no longer by the old one
+    """
+    original = test_client.get("/event/3").json["highlights"]
+    test_client.patch("/event/3", json={"highlights": "Zyzzyva added"})
+    found = test_client.get("/event/search?q=zyzzyva&fields=event_id").json
+    test_client.patch("/event/3", json={"highlights": original})
+    after = test_client.get("/event/search?q=zyzzyva").json
+    assert [e["event_id"] for e in found] == [3]
+    assert after == []
+
+
+def test_event_search_missing_q(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN '/event/search' is requested without q
+    THEN the status code should be 400
+    """
+    response = test_client.get("/event/search")
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("limit", ["0", "-1", "x", "100000"])
+def test_event_search_invalid_limit(test_client, limit):
+    """
+    GIVEN a running Flask app
+    WHEN '/event/search' is requested with a limit that isn't between 1 and MAX_PAGE_SIZE
+    THEN the status code should be 400 and the message should say why
+    """
+    response = test_client.get(f"/event/search?q=rugby&limit={limit}")
+    assert response.status_code == 400
+    assert response.json["message"].startswith("limit must be")
+
+
+def test_patch_event_single_round_trip(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN an event is updated with PATCH '/event/3'
+    THEN the updated event should be returned using one SELECT and one UPDATE
+    AND WHEN an event that doesn't exist is updated
+    THEN the status code should be 404
+    """
+    original = test_client.get("/event/3").json["highlights"]
+    response = test_client.patch("/event/3", json={"highlights": "Changed"})
+    test_client.patch("/event/3", json={"highlights": original})
+    assert response.status_code == 200
+    assert response.json["highlights"] == "Changed"
+    assert response.headers["X-Query-Count"] == "2"
+
+    response = test_client.patch("/event/9999", json={"highlights": "Changed"})
+    assert response.status_code == 404
+
+
+def test_patch_noc_batch(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN PATCH '/noc' is sent an existing NOC, a NOC that doesn't exist and an invalid change
+    THEN the status code should be 207 with the status of each record
+    AND only the existing NOC should be updated
+    """
+    original = test_client.get("/noc/FRA").json["notes"]
+    changes = [
+        {"NOC": "FRA", "notes": "Batch"},
+        {"NOC": "XXX", "notes": "Batch"},
+        {"NOC": "GBR", "region": 1},
+    ]
+    response = test_client.patch("/noc", json=changes)
+    updated = test_client.get("/noc/FRA").json["notes"]
+    test_client.patch("/noc", json=[{"NOC": "FRA", "notes": original}])
+    assert response.status_code == 207
+    assert response.json["updated"] == 1
+    assert [r["status"] for r in response.json["results"]] == [200, 404, 400]
+    assert response.json["results"][0]["record"]["notes"] == "Batch"
+    assert updated == "Batch"
+
+
+def test_patch_bulk_invalid_keys(test_client):
+    """
+    GIVEN a running Flask app
+    WHEN PATCH '/noc' and PATCH '/event' are sent records whose key is a list, an object
+        or a number written as a float
+    THEN the records with a list or object key should have status 400
+    AND the record with the key 1.0 should update event 1
+    """
+    response = test_client.patch("/noc", json=[{"NOC": ["GBR"]}])
+    assert response.status_code == 207
+    assert response.json["results"][0]["status"] == 400
+    assert "NOC" in response.json["results"][0]["errors"]
+
+    original = test_client.get("/event/1").json["highlights"]
+    changes = [{"event_id": {"a": 1}}, {"event_id": 1.0, "highlights": "Bulk"}]
+    response = test_client.patch("/event", json=changes)
+    updated = test_client.get("/event/1").json["highlights"]
+    test_client.patch("/event", json=[{"event_id": 1, "highlights": original}])
+    assert response.status_code == 207
+    assert [r["status"] for r in response.json["results"]] == [400, 200]
+    assert updated == "Bulk"
+
+
+def test_metrics_query_count_and_size(test_client):
+    """
+    GIVEN a running Flask app with METRICS_ENABLED
+    WHEN '/event/2' is requested with a new set of fields, so it isn't cached, and then '/metrics'
+    THEN the histograms should record one SQL query and the response size for the route
+    """
+
+    def sample(text, name):
+        labels = '{endpoint="event_id",method="GET"}'
+        for line in text.splitlines():
+            if line.startswith(name + labels):
+                return float(line.split()[-1])
+        return 0
+
+    before = test_client.get("/metrics").data.decode()
+    response = test_client.get("/event/2?fields=year,NOC,location")
+    after = test_client.get("/metrics").data.decode()
+    name = "http_request_queries"
+    assert sample(after, name + "_sum") - sample(before, name + "_sum") == 1
+    name = "http_response_size_bytes"
+    assert sample(after, name + "_sum") - sample(before, name + "_sum") == len(
+        response.data
+    )
+
+
+def test_metrics_failed_query_not_left_open(app):
+    """
+    GIVEN a running Flask app with METRICS_ENABLED
+    WHEN a SQL statement fails
+    THEN the start time of the statement should not be left on the connection
+    """
+    with db.engine.connect() as connection:
+        with pytest.raises(exc.OperationalError):
+            connection.execute(text("SELECT * FROM no_such_table"))
+        assert "metrics_query_start" not in connection.info
+        connection.execute(text("SELECT 1"))
+        assert "metrics_query_start" not in connection.info